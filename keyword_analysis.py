@@ -1,21 +1,25 @@
 import yake
 import string
-import nltk
 import pandas as pd
+import numpy as np
 from collections import Counter
-from tqdm import trange
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
 
-from utils.keyword_utils import tuple_list_to_strings, count_frequency
+from utils.keyword_utils import count_frequency, count_ngrams, count_phrases, init_extractor, extract_batches, read_chunks
+from utils.keyword_cache import KeywordCache, cache_key
+from utils.term_matrix import DocumentTermMatrix
+from utils.tokenizer import Tokenizer
 
 punctuations = string.punctuation.replace('.', '').replace(',', '')
 translator = str.maketrans('', '', punctuations)
 
 class Keyword_Analysis:
-    def __init__(self, data, num_keywords=15, 
+    def __init__(self, data=None, num_keywords=15, 
                  catch_word=["safe", "safer","safety", "safely", "secure", "security", "securely", "securer", "secured","secures"], 
-                 colname='descriptionHtml', identifier='guid'):
+                 colname='descriptionHtml', identifier='guid', cache_path=None, cache_size=1_000_000, tokenizer='nltk'):
         self.keywords = {} # a dictionary of patent:keywords
-        self.data = data # input dataset
+        self.data = data # input dataset; can be None when streaming from a file
         self.catch_word = catch_word # safe words to catch; can be replaced by other words
         self.colname = colname # column name to use
         self.identifier = identifier # identifier to use
@@ -24,71 +28,144 @@ class Keyword_Analysis:
         self.yake = yake.KeywordExtractor(top = self.num_keywords, lan = 'en', stopwords=None, n = 3) # keywords extractor; allow up to 3-grams
         self.punctuations = string.punctuation.replace('.', '').replace(',', '') # punctuation to remove
         self.translator = str.maketrans('', '', self.punctuations) # translator to use
+        self.tokenizer = Tokenizer(self.translator, mode=tokenizer) # texts are tokenized once, shared by all the counts; 'nltk' or 'regex'
+        # keywords already extracted from the same texts, kept across runs; None to disable
+        self.cache = KeywordCache(cache_path, max_entries=cache_size) if cache_path is not None else None
         
-    def get_word_count(self, catch_word = True, keyword = False): 
+    def get_word_count(self, catch_word = True, keyword = False, sparse = False): 
         ''' 
         Get the frequency of catch words or keywords in the dataset
         Allow up to 3-grams
         input: catch_word (bool): whether to count the frequency of catch words. Default is True
                keyword (bool): whether to count the frequency of keywords. Default is False
+               sparse (bool): whether to return the counts as a sparse document x term matrix instead. Default is False
         output: data. The dataframe with the separate columns of catch word frequencies, and a keyword column filled with a dictionary
                       The dictionary in the keyword column is the frequency of keywords
+                or, if sparse, a DocumentTermMatrix (see utils.term_matrix) with one row per patent and one column per catch word or keyword
         '''
         length = len(self.data)
-        data = self.data.copy()
-        if catch_word:
-            for word in self.catch_word:
-                data[word] = 0
-        if keyword:
-            data['keyword'] = [{}] * length
+        data = self.data.copy(deep=False) # only adds columns, the texts are not copied
+        catch_counts = {word: np.zeros(length, dtype=np.int64) for word in self.catch_word} if catch_word else {}
+        keyword_counts = [{}] * length
+        term_counts = [{}] * length # catch word and keyword counts of every patent, for the sparse output
         # go over the loop
-        for i in trange(length):
-            # get the abstract and name of a patent
-            try: 
-                abstract = self.data[self.colname].iloc[i].translate(self.translator)
-                identifier = self.data[self.identifier].iloc[i]
-                # tokenize the text into 1-3 grams
-                all_words = nltk.word_tokenize(abstract)
-                bigrams = list(nltk.bigrams(all_words))
-                trigrams = list(nltk.trigrams(all_words))
-                ngrams=bigrams+trigrams 
-                ngrams=tuple_list_to_strings(ngrams)+all_words 
-                # count catch word frequency
-                if catch_word: 
-                    for word in self.catch_word:
-                        word_count = ngrams.count(word)
-                        data.at[i, word] = word_count
-                # count keyword frequency 
-                if keyword: 
-                    try: 
-                        keywords_list = self.keywords[identifier] # get the keywords list from the dictionary
-                        keyword_count = count_frequency(keywords_list, ngrams) # count the frequency of keywords
-                        data.at[i, 'keyword'] = keyword_count
-                    except KeyError:
-                        print("No keywords found for patent", identifier)
-            except AttributeError:
-                data.at[i, 'keyword'] = pd.NA
+        rows = zip(self.data[self.colname], self.data[self.identifier])
+        for i, (abstract, identifier) in enumerate(tqdm(rows, total=length)):
+            token_ids = self.tokenizer.token_ids(identifier, abstract)
+            if token_ids is None:
+                keyword_counts[i] = pd.NA
+                continue
+            # count the 1-3 grams of the text once, then look the words up
+            ngram_counts = count_ngrams(token_ids.tolist())
+            # count catch word frequency
+            catch_count = count_phrases(catch_counts, ngram_counts, self.tokenizer.phrase_ids)
+            for word, word_count in catch_count.items():
+                catch_counts[word][i] = word_count
+            # count keyword frequency 
+            if keyword: 
+                try: 
+                    keywords_list = self.keywords[identifier] # get the keywords list from the dictionary
+                    keyword_counts[i] = count_phrases(keywords_list, ngram_counts, self.tokenizer.phrase_ids) # count the frequency of keywords
+                except KeyError:
+                    print("No keywords found for patent", identifier)
+            if sparse:
+                term_counts[i] = {**catch_count, **keyword_counts[i]}
+        if sparse:
+            return DocumentTermMatrix.from_counts(term_counts, index=self.data[self.identifier])
+        for word, word_count in catch_counts.items():
+            data[word] = word_count
+        if keyword:
+            data['keyword'] = pd.Series(keyword_counts, index=data.index, dtype=object)
         return data
     
-    def get_keywords(self):
+    def get_keywords(self, n_jobs=1, batch_size=64):
         ''' 
         Get the keywords from the dataset
+        The texts are normalized, looked up in the cache and extracted batch by batch; with several processes,
+        only a few batches per process are in flight at a time.
+        input: n_jobs (int): number of processes extracting the keywords, each with its own extractor. Default is 1, in this process
+               batch_size (int): number of texts sent to a process at once. Default is 64
         output: data, the dataframe with the keywords column
         '''
-        data = self.data.copy()
-        length = len(self.data)
-        data['keyword'] = [[]] * length
-        for i in trange(length):
-            try:
-                abstract = self.data[self.colname].iloc[i].translate(self.translator)
-                identifier = self.data[self.identifier].iloc[i]
-                keywords = self.yake.extract_keywords(abstract)
-                keywords = [keyword[0] for keyword in keywords]
+        data = self.data.copy(deep=False) # only adds columns, the texts are not copied
+        results = [None] * len(self.data)
+        with tqdm(total=len(results)) as progress:
+            if n_jobs == 1:
+                for context, keywords in extract_batches(self._keyword_batches(results, batch_size), self.yake):
+                    self._save_keywords(results, context, keywords, progress)
+            else:
+                with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_extractor, initargs=(self.num_keywords,)) as executor:
+                    for context, keywords in extract_batches(self._keyword_batches(results, batch_size), executor=executor, max_pending=2 * n_jobs): # results come back in order
+                        self._save_keywords(results, context, keywords, progress)
+        if self.cache is not None:
+            print("Keyword cache:", self.cache.report())
+        for identifier, keywords in zip(self.data[self.identifier], results):
+            if keywords is not None:
                 self.keywords[identifier] = keywords
-                data.at[i, 'keyword'] = keywords
-            except AttributeError:
-                data.at[i, 'keyword'] = pd.NA
+        data['keyword'] = pd.Series([pd.NA if keywords is None else keywords for keywords in results], index=data.index, dtype=object)
         return data
+
+    def _keyword_batches(self, results, batch_size):
+        '''
+        Normalize the texts by batch and fill results with the keywords found in the cache
+        output: yields the context (size of the batch, positions and cache keys of the texts to extract) and these texts
+        '''
+        column = self.data[self.colname]
+        for begin in range(0, len(column), batch_size):
+            texts = [self.tokenizer.normalize(text) for text in column.iloc[begin:begin + batch_size]]
+            positions = [begin + offset for offset, text in enumerate(texts) if text is not None]
+            texts = [texts[position - begin] for position in positions]
+            keys = None
+            if self.cache is not None: # only extract the texts not in the cache
+                keys = [cache_key(text, self.num_keywords) for text in texts]
+                cached = self.cache.get_many(keys)
+                for position, key in zip(positions, keys):
+                    results[position] = cached.get(key)
+                missing = [i for i, key in enumerate(keys) if key not in cached]
+                positions, keys, texts = [positions[i] for i in missing], [keys[i] for i in missing], [texts[i] for i in missing]
+            yield (min(batch_size, len(column) - begin), positions, keys), texts
+
+    def _save_keywords(self, results, context, keywords, progress):
+        '''
+        Store the keywords extracted for a batch in results and in the cache
+        '''
+        size, positions, keys = context
+        for position, extracted in zip(positions, keywords):
+            results[position] = extracted
+        if self.cache is not None and keys:
+            self.cache.put_many(dict(zip(keys, keywords)))
+        progress.update(size)
+
+    def stream(self, source, output_path, chunksize=1000, catch_word=True, keyword_count=False, n_jobs=1):
+        ''' 
+        Get the keywords, and optionally the word counts, of a large file by chunks of rows, appending the results to a csv file.
+        Only one chunk of texts is in memory at a time, and the texts are not written to the output.
+        input: source (str): csv or parquet file with the identifier and text columns
+               output_path (str): csv file to write; overwritten
+               chunksize (int): number of rows per chunk. Default is 1000
+               catch_word (bool): whether to count the frequency of catch words. Default is True
+               keyword_count (bool): whether to count the frequency of keywords. Default is False
+               n_jobs (int): number of processes extracting the keywords, see get_keywords. Default is 1
+        output: int, the number of rows written
+        '''
+        rows = 0
+        # the chunks replace the data and keywords of the object, they are given back at the end
+        data, keywords = self.data, self.keywords
+        try:
+            for chunk in read_chunks(source, [self.identifier, self.colname], chunksize):
+                self.data = chunk
+                self.keywords = {} # only the keywords and tokens of the current chunk are kept
+                self.tokenizer.clear()
+                result = self.get_keywords(n_jobs=n_jobs)
+                result = result[[self.identifier, 'keyword']]
+                if catch_word or keyword_count:
+                    counts = self.get_word_count(catch_word=catch_word, keyword=keyword_count)
+                    result = result.join(counts.drop(columns=[self.identifier, self.colname]).rename(columns={'keyword': 'keyword_count'}))
+                result.to_csv(output_path, mode='w' if rows == 0 else 'a', header=(rows == 0), index=False)
+                rows += len(result)
+        finally:
+            self.data, self.keywords = data, keywords
+        return rows
     
     # def get_keyword_frequency(self):
     #     ''' 
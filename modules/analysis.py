@@ -9,6 +9,10 @@ import numpy as np
 import networkx as nx
 import seaborn as sns
 
+from utils.analysis_helper import build_date_lookup, compute_citation_spans, earliest_by_category
+from utils.data_store import load_table
+from utils.citation_index import CitationIndex
+
 
 df_basics = None
 df_edge_list = None
@@ -19,20 +23,58 @@ def check_path(path_to_data):
     else:
         raise FileNotFoundError(f"{path_to_data} does not exist.\nPlease specify the path to the patent data")
 
-def first_appear_analysis(path_to_data="data", df=df_basics):
-    df_basics=pd.read_csv(os.path.join(path_to_data, "raw/df_basics.csv"))
-    df_edge_list = pd.read_csv(os.path.join(path_to_data, "raw/edge_list.csv"))
-    # Step 1.0 - parent_date_process
-    parent_date_process(path_to_data=path_to_data, df=df) 
-    # 1.1 - subset_category    
-    subset_category(path_to_data=path_to_data) 
-    # 1.2 - join_date    
-    join_date(path_to_data=path_to_data) 
-    # 1.3 - first_date
-    find_earliest_date(path_to_data=path_to_data)
+def first_appear_analysis(path_to_data="data", df=df_basics, in_memory=True, save_intermediate=False):
+    """
+    Find the first appeared patent of every category and plot them over time.
+
+    Args:
+        path_to_data(str, optional): Path to the directory containing the patent data. Defaults to "data".
+        df (pd.DataFrame, optional): the basic patent data. Read from raw/df_basics.csv if not given.
+        in_memory(bool, optional): compute the earliest patents with a single groupby instead of one csv per category. Defaults to True.
+        save_intermediate(bool, optional): also write the per-category csv files to intermediate/first_appear for debugging. Defaults to False.
+    """
+    check_path(path_to_data)
+    if df is None:
+        df = load_table("df_basics", columns=['guid', 'datePublished'], data_path=os.path.join(path_to_data, "raw"))
+    
+    if not in_memory or save_intermediate:
+        # Step 1.0 - parent_date_process
+        parent_date_process(path_to_data=path_to_data, df=df) 
+        # 1.1 - subset_category    
+        subset_category(path_to_data=path_to_data) 
+        # 1.2 - join_date    
+        join_date(path_to_data=path_to_data) 
+    if in_memory:
+        # 1.1 to 1.3 - in one pass
+        find_earliest_in_memory(path_to_data=path_to_data, df=df)
+    else:
+        # 1.3 - first_date
+        find_earliest_date(path_to_data=path_to_data)
     # 1.4 - plot_date
     plot_date(path_to_data=path_to_data)
 
+# 1.1 to 1.3 - merge the dates with the classifications once and find the earliest patent of each category
+def find_earliest_in_memory(path_to_data="data", df=df_basics):
+    """
+    Find the earliest date and corresponding id for each category in memory and save to a csv file.
+
+    Args:
+        path_to_data(str, optional): Path to the directory containing the patent data. Defaults to "data".
+        df (pd.DataFrame, optional): the basic patent data. Read from raw/df_basics.csv if not given.
+    """
+    check_path(path_to_data)
+    
+    # configure path variables and initialize output folder
+    output_path = os.path.join(path_to_data, "processed/first_appeared.csv")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if df is None:
+        df = load_table("df_basics", columns=['guid', 'datePublished'], data_path=os.path.join(path_to_data, "raw"))
+    
+    df_classifications = load_table("patent_classification", data_path=os.path.join(path_to_data, "raw"))
+    first_appeared = earliest_by_category(df_classifications, build_date_lookup(df))
+    first_appeared.to_csv(output_path, index=False)
+    print("steps 2 to 4 Done")
+
 # 1.0 - parent_date_process
 def parent_date_process(path_to_data="data", df=df_basics):
     """
@@ -136,12 +178,13 @@ def find_earliest_date(path_to_data="data"):
     print("step 4 Done")
 
 # 1.4 - plot out how the patents distribute over time
-def plot_date(path_to_data="data"):
+def plot_date(path_to_data="data", plotter=None):
     """
     Plot the distribution of the patents over time.
 
     Args:
         path_to_data(str, optional): Path to the directory containing the patent data. Defaults to "data".
+        plotter (Plotter, optional): add the plot to this plotter (see utils.plotter) instead of showing it. Defaults to None.
     """
     check_path(path_to_data)
 
@@ -153,6 +196,10 @@ def plot_date(path_to_data="data"):
     # Extract the year from the date and Group by year and count the number of patents
     df['Year'] = df['1st_appeared_date'].dt.year
     counts = df.groupby('Year').size()
+    if plotter is not None:
+        plotter.add("first_appeared_by_year", "line", counts, color='skyblue', title='Number of New Classifications Each Year',
+                    xlabel='Year', ylabel='Number of New Classifications')
+        return
     
     # Plot the counts
     plt.figure(figsize=(10, 6))
@@ -167,8 +214,8 @@ def compute_patent_citation_span(path_to_data="data", edge_list=df_edge_list):
     global df_edge_list
     global df_basics
     check_path(path_to_data)
-    df_edge_list = pd.read_csv(os.path.join(path_to_data, "raw/edge_list.csv"))
-    df_basics = pd.read_csv(os.path.join(path_to_data, "raw/df_basics.csv"))
+    df_edge_list = load_table("edge_list", data_path=os.path.join(path_to_data, "raw"))
+    df_basics = load_table("df_basics", columns=['guid', 'datePublished'], data_path=os.path.join(path_to_data, "raw"))
     
     # edge_list = compute_edge_list(df_edge_list)
     # date_span(path_to_data=path_to_data, edge_list=df_edge_list)    
@@ -191,25 +238,10 @@ def date_span(path_to_data, edge_list=df_edge_list):
     
     output_path = os.path.join(path_to_data, "processed/citation_span.csv")
     
-    output = edge_list
-    for i in trange(len(edge_list)):
-        # get the date of both the citing and cited patents
-        id_1 = edge_list.iloc[i]['child']
-        id_2 = edge_list.iloc[i]['parent']
-        date_1_row = df_basics[df_basics['guid'] == id_1]['datePublished'].astype(str)
-        date_1 = date_1_row.values[0] if not date_1_row.empty else pd.NaT
-        
-        date_2_row = df_basics[df_basics['guid'] == id_2]['datePublished'].astype(str)
-        date_2 = date_2_row.values[0] if not date_2_row.empty else pd.NaT
-        
-        if pd.isna(date_1) or pd.isna(date_2):
-            continue
-        
-        date_1 = datetime.strptime(date_1[:10], '%Y-%m-%d')
-        date_2 = datetime.strptime(date_2[:10], '%Y-%m-%d')
-        span = (date_1 - date_2).days
-        # add the citation span to the output dataframe
-        output.at[i, 'span'] = span
+    output = edge_list.copy()
+    # parse the dates once and join both ends of the edges onto them
+    date_lookup = build_date_lookup(df_basics)
+    output['span'] = compute_citation_spans(output, date_lookup)
     
     output.to_csv(output_path, index=False)
     print("step 1 Done - computed citation time span")
@@ -243,11 +275,12 @@ def average_span(path_to_data="data"):
     df_avg_span.to_csv(output_path, index=False)
     print("step 2 Done - computed average time span")
 
-def plot_distribution(path_to_data="data", save=False):
+def plot_distribution(path_to_data="data", save=False, plotter=None):
     """Plot the distribution of the average citation span.
     
     Args:
         path_to_data (str, optional): input file path. Defaults to "output/avg_citation_span.csv".
+        plotter (Plotter, optional): add the plot to this plotter (see utils.plotter) instead of drawing it. Defaults to None.
     """
     check_path(path_to_data)
     # configure path variables
@@ -255,6 +288,10 @@ def plot_distribution(path_to_data="data", save=False):
     output_path = os.path.join(path_to_data, 'processed/avg_span_distribution.png')
     
     df_avg_span = pd.read_csv(data_path)
+    if plotter is not None:
+        plotter.add("avg_span_distribution", "hist", df_avg_span['avg_span'], bins=50, color='pink', edgecolor='red',
+                    title='Distribution of Average Span', xlabel='Average Span', ylabel='Frequency', grid={"axis": "y", "alpha": 0.75})
+        return
     plt.figure(figsize=(10, 6))
     plt.hist(df_avg_span['avg_span'], bins=50, color='pink', edgecolor='red')
     plt.title('Distribution of Average Span')
@@ -298,18 +335,25 @@ def plot_distribution_2(path_to_data="data", save=False, bins=50, kde=True, colo
 class network_plot:
     def __init__(self, edge_list=None):
         self.edge_list = edge_list
+        self.citation_index = None
     
-    def subset_edge_list(self, ids):
+    def subset_edge_list(self, ids, depth=1):
         """Subset the edge list with given ids.
         
         Args:
             ids (list) : list of patent ids
+            depth (int, optional) : number of citation hops around the ids to keep. Defaults to 1, the direct neighbors.
         
         Returns:
-            _TBD_ : subset of the edge list
+            pd.DataFrame : subset of the edge list
         """
         if ids is None:
             return self.edge_list
+        if depth > 1:
+            # expand the ids to the patents within depth - 1 hops, in both directions
+            if self.citation_index is None:
+                self.citation_index = CitationIndex.from_edge_list(self.edge_list)
+            ids = list(ids) + self.citation_index.traverse(ids, "both", depth - 1)['guid'].to_list()
         return self.edge_list[self.edge_list['child'].isin(ids) | self.edge_list['parent'].isin(ids)]
     
     def prepare_edge_list(self, edge_list, threshold=1):
@@ -392,9 +436,20 @@ class network_plot:
         plt.grid(axis='y', alpha=0.75)
         plt.show()
 
-    def plot_freq_count(self, ids):
+    def plot_freq_count(self, ids, plotter=None):
+        """Plot the number of citations of every patent cited by the ids.
+
+        Args:
+            ids (list): the patent ids
+            plotter (Plotter, optional): add the plot to this plotter (see utils.plotter) instead of showing it. Defaults to None.
+        """
         edge_list = self.prepare_edge_list(self.subset_edge_list(ids))
         parent_count = edge_list['parent'].value_counts()
+        if plotter is not None:
+            plotter.add("freq_count", "bar", parent_count, color='turquoise', width=0.8, figsize=(12, 8), rotation=90,
+                        title='Frequency Count of All Cited Patents', xlabel='Patent ID', ylabel='Frequency',
+                        hide_spines=["right", "top"], grid={"visible": True, "which": "both", "linestyle": "--", "linewidth": 0.5, "color": "gray"})
+            return
         # Plot the frequency count of the patents in descending order for all patents
         plt.figure(figsize=(12, 8))  # You may need to adjust this size depending on the total number of patents
         ax = plt.gca()  # Get current axes
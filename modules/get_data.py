@@ -2,9 +2,98 @@ import pandas as pd
 import os
 import numpy as np
 
-df_basics = pd.read_csv("../data/raw/df_basics.csv")
-edge_list = pd.read_csv("../data/raw/edge_list.csv")
-df_classifications = pd.read_csv("../data/raw/patent_classification.csv")
+from utils.data_store import load_table, load_citation_index, store_file
+from utils.list_index import build_list_index
+from utils.date_index import DateIndex
+from utils.cpc_index import CPCIndex
+from utils.analysis_helper import parse_date_column
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "raw")
+
+class PatentDataset:
+    """
+    Handle on the patent tables. Nothing is read until a table is accessed, and each table is loaded only once.
+    """
+    def __init__(self, data_path=DEFAULT_DATA_PATH):
+        self.data_path = data_path
+        self._tables = {}
+        self._citation_index = None
+        self._list_indexes = {}
+        self._date_index = None
+        self._cpc_index = None
+
+    def _load(self, name):
+        if name not in self._tables:
+            self._tables[name] = load_table(name, data_path=self.data_path)
+        return self._tables[name]
+
+    @property
+    def df_basics(self):
+        return self._load("df_basics")
+
+    @property
+    def edge_list(self):
+        return self._load("edge_list")
+
+    @property
+    def df_classifications(self):
+        return self._load("patent_classification")
+
+    @property
+    def citation_index(self):
+        if self._citation_index is None:
+            # the edge list is only read when there is no saved index
+            saved = os.path.exists(store_file("citation_index", self.data_path, extension="npz"))
+            self._citation_index = load_citation_index(data_path=self.data_path, edge_list=None if saved else self.edge_list)
+        return self._citation_index
+
+    @property
+    def date_index(self):
+        if self._date_index is None:
+            self._date_index = DateIndex(self.df_basics["datePublished"])
+        return self._date_index
+
+    @property
+    def cpc_index(self):
+        if self._cpc_index is None:
+            self._cpc_index = CPCIndex(self.df_classifications)
+        return self._cpc_index
+
+    def list_index(self, column_name, casefold=False):
+        key = (column_name, casefold)
+        if key not in self._list_indexes:
+            self._list_indexes[key] = build_list_index(self.df_basics, column_name, casefold)
+        return self._list_indexes[key]
+
+_dataset = None
+
+def set_data_path(data_path):
+    """
+    Point the module to another data folder. The tables are loaded again on their next access.
+
+    Args:
+        data_path (str) : folder containing df_basics.csv, edge_list.csv and patent_classification.csv
+    """
+    global _dataset
+    _dataset = PatentDataset(data_path)
+
+def get_dataset():
+    """
+    Get the dataset handle, creating it on first access.
+
+    Returns:
+        PatentDataset : the handle on the patent tables
+    """
+    global _dataset
+    if _dataset is None:
+        _dataset = PatentDataset()
+    return _dataset
+
+def __getattr__(name):
+    # keep get_data.df_basics, get_data.edge_list and get_data.df_classifications working
+    if name in ("df_basics", "edge_list", "df_classifications"):
+        return getattr(get_dataset(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 method_map = {}
 
@@ -17,6 +106,7 @@ def get_patents(ids=None):
     Returns:
         pd.dataframe: dataframe subsetted
     """
+    df_basics = get_dataset().df_basics
     if not ids:
         return df_basics
     
@@ -35,7 +125,7 @@ def get_citations(patent_id):
         list : list of cited patent ids
     """
     
-    citations = edge_list[edge_list['child'] == patent_id]['parent'].to_list()
+    citations = get_dataset().citation_index.citations(patent_id)
     if len(citations) == 0:
         print(f"Citation not available.")
     return citations
@@ -50,12 +140,12 @@ def get_cited_by(patent_id):
         list : list of patents that cited the patent
     """    
     
-    citations = edge_list[edge_list['parent'] == patent_id]['child'].to_list()
+    citations = get_dataset().citation_index.cited_by(patent_id)
     if len(citations) == 0:
         print(f"Citation not available.")
     return citations
     
-def subset_patents(column_name, requirements):
+def subset_patents(column_name, requirements, match="contains", how="any", casefold=False):
     """
     Subset the patents based on the column name and range.
     The options are "datePublished", "inventorsName", "inventorCity", "inventorState", "assigneeName", "assigneeCity", "assigneeState", "cpcInventiveFlattened".
@@ -63,6 +153,9 @@ def subset_patents(column_name, requirements):
     Args:
         column_name (str) : name of the column e.g. "datePublished" or "inventorsName"
         range (tuple) or names (list): range of the column or list of the names e.g. ("2010-01-01", "2011-01-01") or ["Richard L.", "Marshfield"]
+        match (str, optional) : for the list columns, "exact", "prefix" or "contains". Defaults to "contains", which scans all the distinct values; "exact" and "prefix" are much faster.
+        how (str, optional) : for the list columns, "any" (union) or "all" (intersection) of the names. Defaults to "any".
+        casefold (bool, optional) : for the list columns, match regardless of the case. Defaults to False.
         
     Returns:
         df_subset (dataframe) : the subset of the patents
@@ -71,6 +164,8 @@ def subset_patents(column_name, requirements):
         raise ValueError(f"Column name {column_name} is not in the options.")
     
     subset_method = method_map[column_name]
+    if subset_method is _subset_with_list:
+        return subset_method(column_name, requirements, match=match, how=how, casefold=casefold)
     return subset_method(column_name, requirements)
 
 
@@ -87,54 +182,55 @@ def _subset_by_date(column_name, requirements, df=None):
     start, end = requirements
     
     if df is None:
-        df = df_basics.copy()
-    df["datePublished"] = df["datePublished"].astype(str)
-    df["datePublished"] = pd.to_datetime(df["datePublished"].str[:10])
-    df_subset = df[(df['datePublished'] >= start) & (df['datePublished'] <= end)]
+        date_index = get_dataset().date_index
+        rows = date_index.range(start, end)
+        return get_dataset().df_basics.iloc[rows].assign(datePublished=date_index.dates[rows]).reset_index()
+    dates = parse_date_column(df["datePublished"])
+    mask = (dates >= start) & (dates <= end)
+    df_subset = df[mask].assign(datePublished=dates[mask])
     return df_subset.reset_index()
 
-def _subset_with_list(column_name, requirements, df=None):
+def _subset_with_list(column_name, requirements, df=None, match="contains", how="any", casefold=False):
     """
     Subset the patents based on the column name and list.
+    The inverted index of the column is used, unless another dataframe is given.
     
     Args:
         column_name (str) : name of the column e.g. "inventorsName" or "inventorState"
         requirements (list) : list of the information to subset e.g. ["Richard L.", "Marshfield"] or ["CT", "MA"]
+        match (str, optional) : "exact", "prefix" or "contains". Defaults to "contains", which scans all the distinct values; "exact" and "prefix" are much faster.
+        how (str, optional) : "any" (union) or "all" (intersection). Defaults to "any".
+        casefold (bool, optional) : match regardless of the case. Defaults to False.
         
     Returns:
         df_subset (dataframe) : the subset of the patents
     """
-    
-    if df is None:
-        df = df_basics.copy()
-    
     if column_name not in method_map:
         raise ValueError(f"Column name {column_name} is not in the options.")
     
-    df_subset = df[df[column_name].apply(lambda x: any(item in str(x) for item in requirements))] 
+    if df is None:
+        rows = get_dataset().list_index(column_name, casefold).lookup(requirements, match=match, how=how)
+        return get_dataset().df_basics.iloc[rows].reset_index()
+    
+    if casefold:
+        requirements = [item.casefold() for item in requirements]
+        df_subset = df[df[column_name].apply(lambda x: any(item in str(x).casefold() for item in requirements))]
+    else:
+        df_subset = df[df[column_name].apply(lambda x: any(item in str(x) for item in requirements))] 
     
     return df_subset.reset_index()
 
 def subset_patents_by_cpc(cpc_codes):
     """
-    Filter the patent ids by the cpc codes.
+    Filter the patent ids by the cpc codes. All the codes are looked up in one batch.
     
     Args:
-        cpc_codes (list of list) : list of cpc codes e.g. [["F41","A","3","58"], ["F41", "C", "3", "14"]]
+        cpc_codes (list) : list of cpc codes or prefixes e.g. [["F41","A","3","58"], ["F41", "C", "3", "14"]] or ["F41A", "F41C3/14"]
     
     Returns:
-        ids (list) : the ids of the patents subsetted
-    """
-    ids = []
-    for cpc_list in cpc_codes:
-        df_to_subset = df_classifications.copy()
-        for index, cpc in enumerate(cpc_list):
-            if index > 1:
-                cpc = np.float64(cpc)
-            df_to_subset = df_to_subset[df_to_subset[f"{index}"] == cpc]
-        ids.extend(df_to_subset['4'].to_list())
-    
-    return ids
+        ids (np.ndarray) : the deduplicated ids of the patents subsetted
+    """
+    return get_dataset().cpc_index.lookup(cpc_codes)
 
 method_map = {
     "datePublished": _subset_by_date,
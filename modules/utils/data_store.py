@@ -0,0 +1,129 @@
+import os
+import pandas as pd
+
+from utils.analysis_helper import parse_date_column
+from utils.list_helper import LIST_COLUMNS, decode_list_column, decode_cpc_column
+from utils.citation_index import CitationIndex
+
+# name of the table -> the csv file it is converted from
+TABLES = {
+    "df_basics": "df_basics.csv",
+    "edge_list": "edge_list.csv",
+    "patent_classification": "patent_classification.csv",
+    "extract_3k": "extract_3k.csv",
+}
+DATE_COLUMNS = ['datePublished', 'applicationFilingDate']
+STORE_FOLDER = "store"
+
+
+def store_file(name, data_path="data", store_path=None, extension="parquet"):
+    """
+    Get the path of a file in the store, e.g. the columnar file of a table.
+
+    Args:
+        name (str) : name of the table e.g. "df_basics"
+        data_path (str, optional) : folder containing the raw csv files. Defaults to "data".
+        store_path (str, optional) : folder of the columnar files. Defaults to the "store" folder in data_path.
+        extension (str, optional) : extension of the file. Defaults to "parquet".
+
+    Returns:
+        str : path to the file
+    """
+    if store_path is None:
+        store_path = os.path.join(data_path, STORE_FOLDER)
+    return os.path.join(store_path, f"{name}.{extension}")
+
+def _type_table(name, df):
+    """
+    Convert the columns of a raw table to their proper types: dates are parsed and list columns are decoded.
+    """
+    if name == "df_basics":
+        for col in DATE_COLUMNS:
+            if col in df:
+                df[col] = parse_date_column(df[col])
+        for col in LIST_COLUMNS:
+            if col in df:
+                df[col] = decode_list_column(df[col])
+        if 'cpcInventiveFlattened' in df:
+            df['cpcInventiveFlattened'] = decode_cpc_column(df['cpcInventiveFlattened'])
+    elif name == "patent_classification":
+        for col in ['2', '3']:
+            if col in df:
+                df[col] = df[col].astype("Int64")
+    return df
+
+def convert_to_store(data_path="data", store_path=None, tables=None, compression="zstd"):
+    """
+    Convert the raw csv files to typed and compressed parquet files. Only has to be run once per dataset version.
+    Tables whose csv file is missing are skipped.
+
+    Args:
+        data_path (str, optional) : folder containing the raw csv files. Defaults to "data".
+        store_path (str, optional) : folder of the columnar files. Defaults to the "store" folder in data_path.
+        tables (list, optional) : names of the tables to convert. Defaults to all of TABLES.
+        compression (str, optional) : parquet compression codec. Defaults to "zstd".
+
+    Returns:
+        list : paths of the written files
+    """
+    written = []
+    for name in tables or TABLES:
+        csv_path = os.path.join(data_path, TABLES[name])
+        if not os.path.exists(csv_path):
+            print(f"{csv_path} does not exist, skipping {name}.")
+            continue
+        df = _type_table(name, pd.read_csv(csv_path, low_memory=False))
+        output_path = store_file(name, data_path, store_path)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        df.to_parquet(output_path, index=False, compression=compression)
+        written.append(output_path)
+        print(f"{name} was saved to {output_path}")
+        if name == "edge_list":
+            index_path = store_file("citation_index", data_path, store_path, extension="npz")
+            CitationIndex.from_edge_list(df).save(index_path)
+            written.append(index_path)
+            print(f"citation index was saved to {index_path}")
+    return written
+
+def load_table(name, columns=None, data_path="data", store_path=None):
+    """
+    Load a table, reading only the columns asked for.
+    The columnar file written by convert_to_store is used if it exists, otherwise the raw csv is read.
+
+    Args:
+        name (str) : name of the table e.g. "df_basics" or "edge_list"
+        columns (list, optional) : columns to read. Defaults to all the columns.
+        data_path (str, optional) : folder containing the raw csv files. Defaults to "data".
+        store_path (str, optional) : folder of the columnar files. Defaults to the "store" folder in data_path.
+
+    Returns:
+        pd.DataFrame : the table
+    """
+    if name not in TABLES:
+        raise ValueError(f"Table {name} is not in the options.")
+
+    path = store_file(name, data_path, store_path)
+    if not os.path.exists(path):
+        return pd.read_csv(os.path.join(data_path, TABLES[name]), usecols=columns, low_memory=False)
+
+    # parquet gives back list columns as numpy arrays; they are kept as they are, the list helpers accept both
+    return pd.read_parquet(path, columns=columns)
+
+def load_citation_index(data_path="data", store_path=None, edge_list=None):
+    """
+    Load the citation index saved by convert_to_store, or build it from the edge list if there is none.
+
+    Args:
+        data_path (str, optional) : folder containing the raw csv files. Defaults to "data".
+        store_path (str, optional) : folder of the columnar files. Defaults to the "store" folder in data_path.
+        edge_list (pd.DataFrame, optional) : edge list to build the index from. Loaded with load_table if not given.
+
+    Returns:
+        CitationIndex : the index
+    """
+    path = store_file("citation_index", data_path, store_path, extension="npz")
+    if os.path.exists(path):
+        return CitationIndex.load(path)
+    if edge_list is None:
+        edge_list = load_table("edge_list", data_path=data_path, store_path=store_path)
+    return CitationIndex.from_edge_list(edge_list)
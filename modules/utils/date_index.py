@@ -0,0 +1,53 @@
+import pandas as pd
+import numpy as np
+
+from utils.analysis_helper import parse_date_column
+
+
+class DateIndex:
+    """
+    Sorted index over a date column. The dates are parsed once, and a range is found with two binary searches.
+    """
+    def __init__(self, dates):
+        """
+        Build the index.
+
+        Args:
+            dates (pd.Series) : the dates, as strings such as "2000-01-01 00:00:00+00:00" or already parsed
+        """
+        self.dates = parse_date_column(dates).to_numpy()
+        known = np.flatnonzero(~np.isnat(self.dates))
+        self.order = known[np.argsort(self.dates[known], kind="stable")]
+        self.sorted_dates = self.dates[self.order]
+
+    def _bounds(self, start, end):
+        start, end = np.datetime64(pd.Timestamp(start)), np.datetime64(pd.Timestamp(end))
+        return np.searchsorted(self.sorted_dates, start, side="left"), np.searchsorted(self.sorted_dates, end, side="right")
+
+    def count(self, start, end):
+        """
+        Number of rows dated between start and end, both included.
+
+        Args:
+            start (str) : first date e.g. "2010-01-01"
+            end (str) : last date e.g. "2011-01-01"
+
+        Returns:
+            int : the number of rows
+        """
+        low, high = self._bounds(start, end)
+        return int(high - low)
+
+    def range(self, start, end):
+        """
+        Rows dated between start and end, both included.
+
+        Args:
+            start (str) : first date e.g. "2010-01-01"
+            end (str) : last date e.g. "2011-01-01"
+
+        Returns:
+            np.ndarray : sorted row numbers (positions, not labels)
+        """
+        low, high = self._bounds(start, end)
+        return np.sort(self.order[low:high])
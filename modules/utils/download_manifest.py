@@ -0,0 +1,130 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def file_sha256(path, digest=None):
+    """
+    sha256 of a file, read by blocks.
+
+    Args:
+        path (str) : the file
+        digest (hashlib object, optional) : a digest to update, e.g. to continue hashing a partial download. Defaults to a new one.
+
+    Returns:
+        hashlib object : the digest
+    """
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 16), b""):
+            digest.update(block)
+    return digest
+
+
+class DownloadManifest:
+    """
+    Persistent record of downloads in a SQLite file: url, target path, byte size, sha256 and status of every file.
+    A restarted download skips the files recorded as done whose size on disk still matches.
+    """
+    def __init__(self, path="data/intermediate/download_manifest.sqlite"):
+        """
+        Open the manifest, creating the file if needed.
+
+        Args:
+            path (str, optional) : the SQLite file. Defaults to "data/intermediate/download_manifest.sqlite".
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        # shared by the download threads, the lock serializes the writes
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS downloads (path TEXT PRIMARY KEY, url TEXT NOT NULL, size INTEGER, "
+                                "sha256 TEXT, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, updated INTEGER NOT NULL)")
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM downloads").fetchone()[0]
+
+    def get(self, path):
+        """
+        Record of a file.
+
+        Args:
+            path (str) : the target path
+
+        Returns:
+            dict : url, path, size, sha256, status, attempts and error; None if the file was never recorded
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT url, path, size, sha256, status, attempts, error FROM downloads WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["url", "path", "size", "sha256", "status", "attempts", "error"], row))
+
+    def is_done(self, url, path):
+        """
+        Whether a file was downloaded from the url and is still complete on disk.
+        The check is cheap: the size on disk against the recorded size, the checksum is only read by verify.
+
+        Args:
+            url (str) : the url
+            path (str) : the target path
+
+        Returns:
+            bool : True if the download can be skipped
+        """
+        record = self.get(path)
+        return (record is not None and record["status"] == "done" and record["url"] == url
+                and os.path.exists(path) and os.path.getsize(path) == record["size"])
+
+    def record(self, result):
+        """
+        Record the outcome of a download.
+
+        Args:
+            result (dict) : url, path, status, size, and optionally sha256, attempts and error
+        """
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO downloads (path, url, size, sha256, status, attempts, error, updated) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (result["path"], result["url"], result.get("size"), result.get("sha256"), result["status"],
+                                     result.get("attempts", 0), result.get("error"), time.time_ns()))
+            self.connection.commit()
+
+    def verify(self, paths=None):
+        """
+        Check the files recorded as done against their checksum, marking the missing or changed ones as failed.
+
+        Args:
+            paths (list, optional) : the paths to check. Defaults to None, checking all the files done.
+
+        Returns:
+            list : the paths that failed the check
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT url, path, size, sha256 FROM downloads WHERE status = 'done'").fetchall()
+        if paths is not None:
+            paths = set(paths)
+            rows = [row for row in rows if row[1] in paths]
+        failed = []
+        for url, path, size, sha256 in rows:
+            if not os.path.exists(path) or os.path.getsize(path) != size or file_sha256(path).hexdigest() != sha256:
+                failed.append(path)
+                self.record({"url": url, "path": path, "status": "failed", "size": size, "sha256": sha256, "error": "verification failed"})
+        return failed
+
+    def report(self):
+        """
+        Number of files by status.
+
+        Returns:
+            dict : the count of every status
+        """
+        with self.lock:
+            return dict(self.connection.execute("SELECT status, COUNT(*) FROM downloads GROUP BY status").fetchall())
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,187 @@
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from utils.download_manifest import file_sha256
+
+# status codes worth retrying: rate limited or server side errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class IncompleteDownload(OSError):
+    """
+    The connection ended before the announced number of bytes was received.
+    """
+
+
+# errors worth retrying: the connection failed, timed out or was cut, any other error fails the url at once
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, IncompleteDownload)
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket: at most `rate` requests per second on average, with bursts of up to `capacity` requests.
+    """
+    def __init__(self, rate, capacity=1):
+        """
+        Args:
+            rate (float) : tokens added per second, None for no limit
+            capacity (int, optional) : maximum number of tokens saved up. Defaults to 1.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """
+        Take tokens, waiting until they are available.
+
+        Args:
+            amount (float, optional) : number of tokens, capped at the capacity. Defaults to 1.
+        """
+        if self.rate is None:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Downloader:
+    """
+    Concurrent file downloader: a pool of threads sharing one keep-alive session, a token bucket for the request rate,
+    and retries with exponential backoff of the transient errors of every url. A failed url is reported, it does not stop the others.
+    Files are written to a ".part" file first; an interrupted file is resumed with a Range request.
+    With a manifest, the files already downloaded are skipped and every outcome is recorded.
+    """
+    def __init__(self, headers=None, max_workers=8, rate=2.0, burst=1, retries=3, backoff=1.0, timeout=60, session=None, manifest=None):
+        """
+        Args:
+            headers (dict, optional) : headers of every request. Defaults to None.
+            max_workers (int, optional) : number of concurrent downloads. Defaults to 8.
+            rate (float, optional) : maximum number of requests per second, retries included, None for no limit. Defaults to 2.0.
+            burst (int, optional) : number of requests allowed at once after an idle time. Defaults to 1.
+            retries (int, optional) : number of retries after an attempt failed with a transient error, see RETRY_STATUS and RETRY_ERRORS. Defaults to 3.
+            backoff (float, optional) : wait before the first retry in seconds, doubled at every retry. Defaults to 1.0.
+            timeout (float, optional) : timeout of a request in seconds. Defaults to 60.
+            session (requests.Session, optional) : session to use. Defaults to a new one.
+            manifest (DownloadManifest, optional) : record of the downloads, to skip the completed ones. Defaults to None.
+        """
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.manifest = manifest
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        if headers:
+            session.headers.update(headers)
+        self.session = session
+
+    def _write(self, response, path):
+        """
+        Write a response to the ".part" file of path, appending to it if the response is the rest of a partial download,
+        then move it to path once complete so a file is either complete or absent.
+
+        Returns:
+            tuple : the size and the sha256 of the file
+        """
+        part_path = path + ".part"
+        if response.status_code == 206 and os.path.exists(part_path):
+            digest = file_sha256(part_path)
+            size = os.path.getsize(part_path)
+            mode = "ab"
+        else:
+            digest, size, mode = hashlib.sha256(), 0, "wb"
+        expected = response.headers.get("Content-Length")
+        expected = size + int(expected) if expected is not None else None
+        with open(part_path, mode) as file:
+            for block in response.iter_content(chunk_size=1 << 16):
+                file.write(block)
+                digest.update(block)
+                size += len(block)
+        if expected is not None and size != expected:
+            raise IncompleteDownload(f"incomplete download: {size} of {expected} bytes")
+        os.replace(part_path, path)
+        return size, digest.hexdigest()
+
+    def fetch(self, url, path):
+        """
+        Download one url into a file, retrying the failed attempts.
+
+        Args:
+            url (str) : the url
+            path (str) : the file to write
+
+        Returns:
+            dict : url, path, status ("done", "skipped" or "failed"), status_code, size, sha256, attempts and error
+        """
+        if self.manifest is not None and self.manifest.is_done(url, path):
+            record = self.manifest.get(path)
+            return {"url": url, "path": path, "status": "skipped", "status_code": None, "size": record["size"],
+                    "sha256": record["sha256"], "attempts": 0, "error": None}
+        result = self._fetch(url, path)
+        if self.manifest is not None:
+            self.manifest.record(result)
+        return result
+
+    def _fetch(self, url, path):
+        result = {"url": url, "path": path, "status": "failed", "status_code": None, "size": 0, "sha256": None, "attempts": 0, "error": None}
+        part_path = path + ".part"
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.bucket.acquire()
+            result["attempts"] = attempt + 1
+            # ask only for the missing bytes of an interrupted download
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else None
+            try:
+                with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                    result["status_code"] = response.status_code
+                    if response.status_code in (200, 206):
+                        result["size"], result["sha256"] = self._write(response, path)
+                        result["status"], result["error"] = "done", None
+                        return result
+                    if response.status_code == 416:
+                        # the partial file does not match the remote one, start over
+                        os.remove(part_path)
+                    result["error"] = f"status code {response.status_code}"
+                    if response.status_code not in RETRY_STATUS | {416}:
+                        return result
+            except RETRY_ERRORS as e:
+                result["error"] = repr(e)
+            except (requests.RequestException, OSError) as e:
+                # e.g. a missing or malformed url, retrying does not help
+                result["error"] = repr(e)
+                return result
+        return result
+
+    def download(self, jobs):
+        """
+        Download files concurrently.
+
+        Args:
+            jobs (list) : (url, path) pairs
+
+        Returns:
+            list : the result of every job, see fetch, in the order of the jobs
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda job: self.fetch(*job), jobs))
@@ -0,0 +1,246 @@
+import os
+import gc
+import ast
+import re
+import hashlib
+import pandas as pd
+import numpy as np
+
+# a list of quoted strings without quotes or backslashes inside, as written by str(list)
+SIMPLE_LIST_PATTERN = re.compile(r"\['[^'\"\\]*'(?:, '[^'\"\\]*')*\]")
+# a bare value such as "Hartford", which is not a python literal and ends up wrapped into a list
+PLAIN_VALUE_PATTERN = re.compile(r"(?!(?:None|True|False)$)[A-Za-z][^'\"]*")
+LIST_COLUMNS = ['inventorsName', 'inventorCity', 'inventorState', 'assigneeName', 'assigneeCity', 'assigneeState']
+
+def convert_string_to_list(value):
+    """
+    Convert a stringified python list such as "['CT', 'MA']" to a list.
+    Lists are returned as they are, plain strings are wrapped into a list and other values become pd.NA.
+
+    Args:
+        value (str) : the value to convert
+
+    Returns:
+        list : the decoded list
+    """
+    if isinstance(value, list):
+        return value
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if pd.isna(value):
+        return value
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        if type(value) == str:
+            return [value]
+        else:
+            return pd.NA
+
+def decode_list_column(column):
+    """
+    Decode a whole column of stringified python lists at once.
+    Lists of plain quoted strings such as "['Smith, John', 'Doe, Jane']" and bare values such as "Hartford" are recognized
+    with compiled regexes and decoded in bulk; anything else (escaped quotes, other literals) goes through convert_string_to_list.
+
+    Args:
+        column (pd.Series) : the column to decode
+
+    Returns:
+        pd.Series : the column holding lists
+    """
+    if is_decoded(column):
+        return column.apply(convert_string_to_list)
+    strings = column.astype(object)
+    simple = strings.str.fullmatch(SIMPLE_LIST_PATTERN).fillna(False).to_numpy(dtype=bool)
+    plain = strings.str.fullmatch(PLAIN_VALUE_PATTERN).fillna(False).to_numpy(dtype=bool)
+    empty = (strings == "[]").to_numpy(dtype=bool)
+    missing = strings.isna().to_numpy()
+
+    decoded = np.empty(len(strings), dtype=object)
+    decoded[simple] = strings[simple].str.slice(2, -2).str.split("', '").to_numpy()
+    decoded[missing] = strings[missing].to_numpy()
+    values = strings.to_numpy()
+    for position in np.flatnonzero(plain):
+        decoded[position] = [values[position]]
+    for position in np.flatnonzero(empty):
+        decoded[position] = []
+    for position in np.flatnonzero(~(simple | plain | empty | missing)):
+        decoded[position] = convert_string_to_list(values[position])
+    return pd.Series(decoded, index=column.index, name=column.name, dtype=object)
+
+def explode_list_column(column, replacements=None):
+    """
+    Explode a list column into (row_id, value) pairs, the values being stored as a categorical:
+    integer codes plus one dictionary of the distinct values.
+    Like DataFrame.explode, empty lists and missing values give one missing value.
+
+    Args:
+        column (pd.Series) : column holding lists or arrays, or stringified lists which are decoded first
+        replacements (dict, optional) : values to replace, applied once to the dictionary. Defaults to None.
+
+    Returns:
+        np.ndarray : the row numbers (positions) of the values in the column, as int32
+        pd.Categorical : the exploded values
+    """
+    if not is_decoded(column):
+        column = decode_list_column(column)
+    lists = []
+    for value in column:
+        if not isinstance(value, (list, np.ndarray)):
+            value = [value]
+        lists.append(value if len(value) > 0 else [np.nan])
+    lengths = np.fromiter((len(value) for value in lists), dtype=np.int64, count=len(lists))
+    row_ids = np.repeat(np.arange(len(lists), dtype=np.int32), lengths)
+    codes, uniques = pd.factorize(pd.Series([value for values in lists for value in values], dtype=object))
+    if replacements:
+        # replace in the dictionary, then merge the codes of the values mapped to the same one
+        category_codes, uniques = pd.factorize(pd.Series(uniques, dtype=object).replace(replacements))
+        codes = np.where(codes >= 0, category_codes[codes], -1)
+    return row_ids, pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=object))
+
+def pack_list_column(column):
+    """
+    Arrays of a list column that can be saved without pickling: the row numbers and the codes of explode_list_column,
+    its categories as strings, and the kind of every row (0 a list, 1 a missing value, 2 an empty list).
+
+    Args:
+        column (pd.Series) : column holding lists or arrays
+
+    Returns:
+        dict : the arrays, None if some values are not strings
+    """
+    row_ids, values = explode_list_column(column)
+    categories = np.asarray(values.categories, dtype=object)
+    if not all(isinstance(category, str) for category in categories):
+        return None
+    kinds = np.zeros(len(column), dtype=np.int8)
+    kinds[column.isna().to_numpy()] = 1
+    kinds[[isinstance(value, (list, np.ndarray)) and len(value) == 0 for value in column]] = 2
+    return {"row_ids": row_ids, "codes": values.codes.astype(np.int32), "categories": categories.astype(str), "kinds": kinds}
+
+def unpack_list_column(arrays, index=None, name=None):
+    """
+    Rebuild a list column from the arrays of pack_list_column.
+
+    Args:
+        arrays (dict) : the arrays
+        index (pd.Index, optional) : index of the column. Defaults to None.
+        name (str, optional) : name of the column. Defaults to None.
+
+    Returns:
+        pd.Series : the column holding lists
+    """
+    kinds = arrays["kinds"]
+    # code -1, a missing value inside a list, points to the appended None
+    values = np.append(arrays["categories"].astype(object), None)[arrays["codes"]].tolist()
+    bounds = np.searchsorted(arrays["row_ids"], np.arange(len(kinds) + 1)).tolist()
+    # creating many small lists triggers the garbage collector over and over, while they cannot hold cycles
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        lists = [values[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    finally:
+        if enabled:
+            gc.enable()
+    for position in np.flatnonzero(kinds == 1):
+        lists[position] = np.nan
+    for position in np.flatnonzero(kinds == 2):
+        lists[position] = []
+    return pd.Series(lists, index=index, name=name, dtype=object)
+
+def save_decoded_columns(path, data, list_columns, date_columns):
+    """
+    Save decoded list columns and date columns to a .npz file, without pickling.
+
+    Args:
+        path (str) : the .npz file
+        data (pd.DataFrame) : the dataset
+        list_columns (list) : the columns holding lists, the missing ones are ignored
+        date_columns (list) : the datetime columns, the missing ones are ignored
+
+    Returns:
+        bool : False if a column could not be saved, in which case nothing is written
+    """
+    arrays = {}
+    for col in list_columns:
+        if col in data:
+            packed = pack_list_column(data[col])
+            if packed is None:
+                return False
+            arrays.update({f"list__{col}__{key}": value for key, value in packed.items()})
+    for col in date_columns:
+        if col in data:
+            dates = data[col].to_numpy()
+            if dates.dtype.kind != "M":
+                return False
+            arrays[f"date__{col}"] = dates
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, **arrays)
+    return True
+
+def load_decoded_columns(path, data):
+    """
+    Load the columns saved with save_decoded_columns into a dataset.
+
+    Args:
+        path (str) : the .npz file
+        data (pd.DataFrame) : the dataset, modified in place
+
+    Returns:
+        pd.DataFrame : the dataset
+    """
+    with np.load(path, allow_pickle=False) as saved:
+        arrays = {key: saved[key] for key in saved.files}
+    for key, value in arrays.items():
+        kind, col, *part = key.split("__")
+        if kind == "date":
+            data[col] = pd.Series(value, index=data.index, name=col)
+        elif part == ["kinds"]:
+            packed = {name: arrays[f"list__{col}__{name}"] for name in ["row_ids", "codes", "categories", "kinds"]}
+            data[col] = unpack_list_column(packed, index=data.index, name=col)
+    return data
+
+def fingerprint(data, columns):
+    """
+    Hash the content of some columns, to tell whether a dataset changed since it was last processed.
+
+    Args:
+        data (pd.DataFrame) : the dataset
+        columns (list) : the columns to hash, the missing ones are ignored
+
+    Returns:
+        str : the hex digest
+    """
+    digest = hashlib.sha1()
+    for col in columns:
+        if col in data:
+            digest.update(col.encode())
+            digest.update(pd.util.hash_pandas_object(data[col].astype(str), index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def decode_cpc_column(column):
+    """
+    Decode the cpcInventiveFlattened column, e.g. "F41A3/58;F41C3/14", into lists of cpc codes.
+
+    Args:
+        column (pd.Series) : the column to decode
+
+    Returns:
+        pd.Series : the column holding lists
+    """
+    column = column.str.replace(r"[\[\]']", "", regex=True)
+    return column.apply(lambda x: x.split(';') if pd.notna(x) else x)
+
+def is_decoded(column):
+    """
+    Check whether a column already holds lists instead of strings.
+
+    Args:
+        column (pd.Series) : the column to check
+
+    Returns:
+        bool : True if the first non-missing value is a list
+    """
+    valid = column.dropna()
+    return len(valid) > 0 and isinstance(valid.iloc[0], (list, np.ndarray))
@@ -0,0 +1,161 @@
+import os
+import json
+import glob
+import pandas as pd
+
+RESULT_COLUMNS = ['id', 'response']
+
+
+def _fsync_directory(path):
+    # make a rename or a new file durable; directories cannot be opened on windows
+    if os.name != "nt":
+        fd = os.open(path or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _write_csv(frame, path):
+    """
+    Write a csv file next to path and fsync it, without replacing path yet.
+
+    Returns:
+        str : the temporary file
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", newline="", encoding="utf-8") as file:
+        frame.to_csv(file, index=False)
+        file.flush()
+        os.fsync(file.fileno())
+    return temp_path
+
+
+class ResultStore:
+    """
+    Append-only store of the API results: every checkpoint appends its new results as JSON lines to a segment file
+    and fsyncs it, so its cost only depends on the number of new results. A crash can at most leave a torn last line,
+    which is skipped when reading. compact merges the segments into the raw and refined csv files and removes them.
+    """
+    def __init__(self, path="data/results", raw_path="data/raw.csv", refined_path="data/refined.csv", max_segment_bytes=64 << 20):
+        """
+        Open the store, finishing an interrupted compaction.
+
+        Args:
+            path (str, optional) : the folder of the segments. Defaults to "data/results".
+            raw_path (str, optional) : the csv file of the raw responses. Defaults to "data/raw.csv".
+            refined_path (str, optional) : the csv file of the refined responses. Defaults to "data/refined.csv".
+            max_segment_bytes (int, optional) : size from which the next checkpoint starts a new segment. Defaults to 64 MiB.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.raw_path = raw_path
+        self.refined_path = refined_path
+        self.max_segment_bytes = max_segment_bytes
+        self.marker_path = os.path.join(path, "compaction.json")
+        self.recover()
+        # a new segment per session, so nothing is appended after a torn line of a previous one
+        self.segment = None
+
+    def segments(self):
+        """
+        The segment files, oldest first.
+
+        Returns:
+            list : the paths
+        """
+        return sorted(glob.glob(os.path.join(self.path, "segment-*.jsonl")))
+
+    def _next_segment(self):
+        numbers = [int(os.path.basename(segment)[8:-6]) for segment in self.segments()]
+        return os.path.join(self.path, f"segment-{max(numbers, default=0) + 1:06d}.jsonl")
+
+    def append(self, raw, refined):
+        """
+        Append results and fsync them.
+
+        Args:
+            raw (list) : [id, response] pairs of the raw responses
+            refined (list) : [id, response] pairs of the refined responses
+
+        Returns:
+            int : the number of lines written
+        """
+        lines = [json.dumps({"kind": "raw", "id": identifier, "response": response}) for identifier, response in raw]
+        lines += [json.dumps({"kind": "refined", "id": identifier, "response": response}) for identifier, response in refined]
+        if not lines:
+            return 0
+        if self.segment is None or os.path.getsize(self.segment) >= self.max_segment_bytes:
+            self.segment = self._next_segment()
+        with open(self.segment, "a", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        _fsync_directory(self.path)
+        return len(lines)
+
+    def read(self):
+        """
+        The results of the segments, not compacted yet.
+
+        Returns:
+            tuple : the raw and the refined results, as dataframes with the columns id and response
+        """
+        records = {"raw": [], "refined": []}
+        for segment in self.segments():
+            with open(segment, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # torn line of a crashed write
+                    records[record["kind"]].append([record["id"], record["response"]])
+        return (pd.DataFrame(records["raw"], columns=RESULT_COLUMNS),
+                pd.DataFrame(records["refined"], columns=RESULT_COLUMNS))
+
+    def recover(self):
+        """
+        Finish a compaction interrupted after its csv files were written: move them in place and drop its segments.
+        """
+        if not os.path.exists(self.marker_path):
+            return
+        with open(self.marker_path, encoding="utf-8") as file:
+            marker = json.load(file)
+        for temp_path, path in marker["files"]:
+            if os.path.exists(temp_path):
+                os.replace(temp_path, path)
+        for segment in marker["segments"]:
+            if os.path.exists(segment):
+                os.remove(segment)
+        os.remove(self.marker_path)
+
+    def compact(self):
+        """
+        Merge the segments into the raw and refined csv files, replaced atomically, then remove the segments.
+
+        Returns:
+            int : the number of results merged
+        """
+        segments = self.segments()
+        if not segments:
+            return 0
+        raw_new, refined_new = self.read()
+        # responses are json in the segments, and their python representation in the csv files as before
+        raw_new['response'] = raw_new['response'].map(lambda response: response if isinstance(response, str) else str(response))
+        files = []
+        for path, new in [(self.raw_path, raw_new), (self.refined_path, refined_new)]:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            frame = pd.concat([pd.read_csv(path), new], ignore_index=True) if os.path.exists(path) else new
+            files.append((_write_csv(frame, path), path))
+        # the marker makes the replacement and the removal redoable, see recover
+        marker_temp = self.marker_path + ".tmp"
+        with open(marker_temp, "w", encoding="utf-8") as file:
+            json.dump({"files": files, "segments": segments}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(marker_temp, self.marker_path)
+        _fsync_directory(self.path)
+        self.recover()
+        self.segment = None
+        return len(raw_new) + len(refined_new)
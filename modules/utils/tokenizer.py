@@ -0,0 +1,127 @@
+import re
+import nltk
+import pandas as pd
+import numpy as np
+
+TOKENIZER_MODES = ["nltk", "regex"]
+# words, keeping numbers such as 3.5 or 1,000 and contractions together, and single punctuation marks
+TOKEN_PATTERN = re.compile(r"\w+(?:[.,']\w+)*|[^\w\s]")
+
+
+class Tokenizer:
+    """
+    Text preparation shared by the keyword extraction and the n-gram counting.
+    Every document is normalized and tokenized once; its tokens are cached as integer ids against a vocabulary
+    that grows as new tokens are seen.
+    """
+    def __init__(self, translator, mode="nltk"):
+        """
+        Args:
+            translator (dict) : str.translate table applied to the texts, e.g. removing the punctuation
+            mode (str, optional) : "nltk" for nltk.word_tokenize, or "regex" for a faster single regex pass
+                that approximates it. Defaults to "nltk".
+        """
+        if mode not in TOKENIZER_MODES:
+            raise ValueError(f"Mode {mode} is not in the options {TOKENIZER_MODES}.")
+        self.translator = translator
+        self.mode = mode
+        self.vocabulary = {}
+        self.tokens = []
+        self.documents = {}
+
+    def normalize(self, text):
+        """
+        Normalize a text.
+
+        Args:
+            text (str) : the text
+
+        Returns:
+            str : the text, None if it is missing
+        """
+        return text.translate(self.translator) if isinstance(text, str) else None
+
+    def tokenize(self, text):
+        """
+        Split a normalized text into tokens.
+
+        Args:
+            text (str) : the normalized text
+
+        Returns:
+            list : the tokens
+        """
+        if self.mode == "regex":
+            return TOKEN_PATTERN.findall(text)
+        return nltk.word_tokenize(text)
+
+    def encode(self, tokens):
+        """
+        Ids of tokens, adding the new ones to the vocabulary.
+
+        Args:
+            tokens (list) : the tokens
+
+        Returns:
+            np.ndarray : the ids, as int32
+        """
+        # look up every distinct token of the document once
+        codes, uniques = pd.factorize(np.asarray(tokens, dtype=object))
+        unique_ids = np.empty(len(uniques), dtype=np.int32)
+        for position, token in enumerate(uniques):
+            token_id = self.vocabulary.get(token)
+            if token_id is None:
+                token_id = self.vocabulary[token] = len(self.tokens)
+                self.tokens.append(token)
+            unique_ids[position] = token_id
+        return unique_ids[codes]
+
+    def token_ids(self, identifier, text):
+        """
+        Token ids of a document, computed the first time and then read from the cache.
+        The cache keeps the text of every id and compares it on a hit, so another text under the same id
+        (e.g. after changing the data or the column) is tokenized again and replaces the cached one.
+
+        Args:
+            identifier (str) : the id of the document e.g. the patent id
+            text (str) : the raw text of the document
+
+        Returns:
+            np.ndarray : the ids, None if the text is missing
+        """
+        cached = self.documents.get(identifier)
+        # compared by identity first, the text is usually the very object of the previous call
+        if cached is None or not (cached[0] is text or (isinstance(text, str) and cached[0] == text)):
+            normalized = self.normalize(text)
+            cached = self.documents[identifier] = (text, self.encode(self.tokenize(normalized)) if normalized is not None else None)
+        return cached[1]
+
+    def phrase_ids(self, phrase):
+        """
+        Ids of the words of a phrase, to look it up in n-grams of ids; -1 for a word never seen.
+
+        Args:
+            phrase (str) : the phrase e.g. "gun safety"
+
+        Returns:
+            tuple : the ids
+        """
+        return tuple(self.vocabulary.get(word, -1) for word in phrase.split(" "))
+
+    def decode(self, ids):
+        """
+        Tokens of ids.
+
+        Args:
+            ids (list) : the ids
+
+        Returns:
+            list : the tokens
+        """
+        return [self.tokens[token_id] for token_id in ids]
+
+    def clear(self):
+        """
+        Drop the cached documents, keeping the vocabulary.
+        """
+        self.documents = {}
@@ -2,8 +2,19 @@ import base64
 import requests
 import pandas as pd
 
+API_URL = "https://api.openai.com/v1/chat/completions"
+
 class API_calling:
-    def __init__(self):
+    def __init__(self, url=API_URL, timeout=120, session=None):
+        '''
+        Args:
+            url (str): The chat completions endpoint (optional, default=API_URL), e.g. a local mock server for testing
+            timeout (float): The timeout of a request in seconds (optional, default=120)
+            session (requests.Session): The session to send the requests with, reusing its connections (optional, default=a new one)
+        '''
+        self.url = url
+        self.timeout = timeout
+        self.session = session if session is not None else requests.Session()
         self.payload = None
         self.prompt = "From a set of images, please extract the title, authors, date of invention, and city of invention from the image with detailed description on the patent and only tell me the information in such format: Title: [title]\n Authors: [authors]\n Invention_Date: [date]\n City: [city]\n Once you identified the first page of the patent document (not image) give me information above, stopping immediately."
         self.prompt_test = "From a set of images, please extract the title, authors, date of invention, and city of invention from the image with detailed description on the patent and only tell me the information in such format: Title: [title]\n Authors: [authors]\n Invention_Date: [date]\n City: [city]\n. Once you identified the first page of the patent document (not image) give me information above, stopping immediately and tell me the page index that you stopped at."
@@ -35,10 +46,22 @@ class API_calling:
             self.payload = self.create_payload(image_path_list)
             
             print("api calling...")
-            response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=self.payload)
-            return response.json()
+            return self.post(self.payload, headers).json()
         except Exception as e:
             print(f"An error occurred: {e}")
+
+    def post(self, payload, headers):
+        '''
+        sends a payload to the API
+        
+        Args:
+            payload (dict): The payload, see create_payload
+            headers (dict): The headers, with the API key
+        
+        Returns:
+            requests.Response: The response of the API
+        '''
+        return self.session.post(self.url, headers=headers, json=payload, timeout=self.timeout)
     
     def create_payload(self, image_paths):
         '''
@@ -9,6 +9,10 @@ from pandas import NaT
 import seaborn as sns
 import numpy as np
 
+from utils.analysis_helper import build_date_lookup, compute_citation_spans, earliest_by_category
+from utils.data_store import load_table
+from utils.citation_index import CitationIndex
+
 
 
 class first_appear:
@@ -16,12 +20,45 @@ class first_appear:
         os.makedirs('temp', exist_ok=True)
         os.makedirs('output', exist_ok=True)
 
-    def run(self, patent_path="data/df_basics.csv", classification_path="data/patent_classification.csv"):
-        self.parent_date_process(patents_path=patent_path) # 1.0 - parent_date_process
-        first_appear.subset_category(classification_path=classification_path) # 1.1 - subset_category        
-        first_appear.join_date() # 1.2 - join_date
-        first_appear.find_earliest_date() # 1.3 - first_date
-        first_appear.plot_date() # 1.4 - plot_date
+    def run(self, patent_path="data/df_basics.csv", classification_path="data/patent_classification.csv", in_memory=True, save_intermediate=False):
+        """
+        Find the first appeared patent of every category and plot them over time.
+
+        Args:
+            patent_path (str, optional): path to the basic patent data. Defaults to "data/df_basics.csv".
+            classification_path (str, optional): path to the cpc classifications. Defaults to "data/patent_classification.csv".
+            in_memory (bool, optional): compute the earliest patents with a single groupby instead of one csv per category. Defaults to True.
+            save_intermediate (bool, optional): also write the per-category csv files to temp/ for debugging. Defaults to False.
+        """
+        if not in_memory:
+            self.parent_date_process(patents_path=patent_path) # 1.0 - parent_date_process
+            self.subset_category(classification_path=classification_path) # 1.1 - subset_category        
+            self.join_date() # 1.2 - join_date
+            self.find_earliest_date() # 1.3 - first_date
+            self.plot_date() # 1.4 - plot_date
+            return
+        
+        if save_intermediate:
+            self.parent_date_process(patents_path=patent_path)
+            self.subset_category(classification_path=classification_path)
+            self.join_date()
+        self.find_earliest_in_memory(patents_path=patent_path, classification_path=classification_path) # 1.1 to 1.3 in one pass
+        self.plot_date() # 1.4 - plot_date
+
+    # 1.1 to 1.3 - merge the dates with the classifications once and find the earliest patent of each category
+    def find_earliest_in_memory(self, patents_path="data/df_basics.csv", classification_path="data/patent_classification.csv", output_path="output/first_appeared.csv"):
+        """
+        Find the earliest date and corresponding id for each category in memory and save to a csv file.
+
+        Args:
+            patents_path (str, optional): path to the basic patent data. Defaults to "data/df_basics.csv".
+            classification_path (str, optional): path to the cpc classifications. Defaults to "data/patent_classification.csv".
+            output_path (str, optional): output data path. Defaults to "output/first_appeared.csv".
+        """
+        df_patent_date = pd.read_csv(patents_path, usecols=['guid', 'datePublished'], low_memory=False)
+        df_classifications = pd.read_csv(classification_path, low_memory=False)
+        first_appeared = earliest_by_category(df_classifications, build_date_lookup(df_patent_date))
+        first_appeared.to_csv(output_path, index=False)
 
     # 1.0 - parent_date_process
     def parent_date_process(self, patents_path="data/df_basics.csv", output_path="temp/patent_date.csv"):
@@ -102,18 +139,23 @@ class first_appear:
         first_appeared.to_csv(output_path, index=False)
 
     # 1.4 - plot out how the patents distribute over time
-    def plot_date(self, file_path="output/first_appeared.csv"):
+    def plot_date(self, file_path="output/first_appeared.csv", plotter=None):
         """
         Plot the distribution of the patents over time.
 
         Args:
             file_path (str, optional): input file path. Defaults to "output/first_appeared.csv".
+            plotter (Plotter, optional): add the plot to this plotter (see utils.plotter) instead of showing it. Defaults to None.
         """
         df = pd.read_csv(file_path, low_memory=False)
         df['1st_appeared_date'] = pd.to_datetime(df['1st_appeared_date'])
         # Extract the year from the date and Group by year and count the number of patents
         df['Year'] = df['1st_appeared_date'].dt.year
         counts = df.groupby('Year').size()
+        if plotter is not None:
+            plotter.add("first_appeared_by_year", "line", counts, color='skyblue', title='Number of New Classifications Each Year',
+                        xlabel='Year', ylabel='Number of New Classifications')
+            return
         
         # Plot the counts
         plt.figure(figsize=(10, 6))
@@ -124,9 +166,13 @@ class first_appear:
         plt.show()        
     
 class compute_patent_citation_span:
-    def __init__(self, patents_path="data/df_basics.csv", compute_edge_list=False):
-        self.df_basics = pd.read_csv(patents_path)
-        self.edge_list = pd.read_csv("data/edge_list.csv")
+    def __init__(self, patents_path=None, compute_edge_list=False, data_path="data"):
+        # only the ids and the dates are needed to compute the spans
+        if patents_path is None:
+            self.df_basics = load_table("df_basics", columns=['guid', 'datePublished'], data_path=data_path)
+        else:
+            self.df_basics = pd.read_csv(patents_path, usecols=['guid', 'datePublished'])
+        self.edge_list = load_table("edge_list", data_path=data_path)
         if compute_edge_list:
             self.compute_edge_list()
             
@@ -145,23 +191,9 @@ class compute_patent_citation_span:
             output_path (str, optional): output file path. Defaults to "output/citation_span.csv".
         """
         output = self.edge_list.copy()
-        for i in trange(len(self.edge_list)):
-            # get the date of both the citing and cited patents
-            id_1 = self.edge_list.iloc[i]['child']
-            id_2 = self.edge_list.iloc[i]['parent']
-            date_1_row = self.df_basics[self.df_basics['guid'] == id_1]['datePublished'].astype(str)
-            date_1 = date_1_row.values[0] if not date_1_row.empty else NaT
-            
-            date_2_row = self.df_basics[self.df_basics['guid'] == id_2]['datePublished'].astype(str)
-            date_2 = date_2_row.values[0] if not date_2_row.empty else NaT
-            
-            if pd.isna(date_1) or pd.isna(date_2):
-                continue
-            date_1 = datetime.strptime(date_1[:10], '%Y-%m-%d')
-            date_2 = datetime.strptime(date_2[:10], '%Y-%m-%d')
-            span = (date_1 - date_2).days
-            # add the citation span to the output dataframe
-            output.at[i, 'span'] = span
+        # parse the dates once and join both ends of the edges onto them
+        date_lookup = build_date_lookup(self.df_basics)
+        output['span'] = compute_citation_spans(output, date_lookup)
         
         output.to_csv(output_path, index=False)
         
@@ -188,13 +220,18 @@ class compute_patent_citation_span:
         df_avg_span['avg_span'] = span_list
         df_avg_span.to_csv(output_path, index=False)
     
-    def plot_distribution(self, data_path="output/avg_citation_span.csv", save=False, output_path="output/avg_span_distribution.png"):
+    def plot_distribution(self, data_path="output/avg_citation_span.csv", save=False, output_path="output/avg_span_distribution.png", plotter=None):
         """Plot the distribution of the average citation span.
         
         Args:
             data_path (str, optional): input file path. Defaults to "output/avg_citation_span.csv".
+            plotter (Plotter, optional): add the plot to this plotter (see utils.plotter) instead of drawing it. Defaults to None.
         """
         df_avg_span = pd.read_csv(data_path)
+        if plotter is not None:
+            plotter.add("avg_span_distribution", "hist", df_avg_span['avg_span'], bins=50, color='pink', edgecolor='red',
+                        title='Distribution of Average Span', xlabel='Average Span', ylabel='Frequency', grid={"axis": "y", "alpha": 0.75})
+            return
         plt.figure(figsize=(10, 6))
         plt.hist(df_avg_span['avg_span'], bins=50, color='pink', edgecolor='red')
         plt.title('Distribution of Average Span')
@@ -232,19 +269,26 @@ class compute_patent_citation_span:
     
 class network_plot:
     def __init__(self):
-        self.edge_list = pd.read_csv("data/raw/edge_list.csv")
+        self.edge_list = load_table("edge_list", data_path="data/raw")
+        self.citation_index = None
     
-    def subset_edge_list(self, ids):
+    def subset_edge_list(self, ids, depth=1):
         """Subset the edge list with given ids.
         
         Args:
             ids (list) : list of patent ids
+            depth (int, optional) : number of citation hops around the ids to keep. Defaults to 1, the direct neighbors.
         
         Returns:
-            _TBD_ : subset of the edge list
+            pd.DataFrame : subset of the edge list
         """
         if ids is None:
             return self.edge_list
+        if depth > 1:
+            # expand the ids to the patents within depth - 1 hops, in both directions
+            if self.citation_index is None:
+                self.citation_index = CitationIndex.from_edge_list(self.edge_list)
+            ids = list(ids) + self.citation_index.traverse(ids, "both", depth - 1)['guid'].to_list()
         return self.edge_list[self.edge_list['child'].isin(ids) | self.edge_list['parent'].isin(ids)]
     
     def prepare_edge_list(self, edge_list, threshold=1):
@@ -327,9 +371,20 @@ class network_plot:
         plt.grid(axis='y', alpha=0.75)
         plt.show()
 
-    def plot_freq_count(self, ids):
+    def plot_freq_count(self, ids, plotter=None):
+        """Plot the number of citations of every patent cited by the ids.
+
+        Args:
+            ids (list): the patent ids
+            plotter (Plotter, optional): add the plot to this plotter (see utils.plotter) instead of showing it. Defaults to None.
+        """
         edge_list = self.prepare_edge_list(self.subset_edge_list(ids))
         parent_count = edge_list['parent'].value_counts()
+        if plotter is not None:
+            plotter.add("freq_count", "bar", parent_count, color='turquoise', width=0.8, figsize=(12, 8), rotation=90,
+                        title='Frequency Count of All Cited Patents', xlabel='Patent ID', ylabel='Frequency',
+                        hide_spines=["right", "top"], grid={"visible": True, "which": "both", "linestyle": "--", "linewidth": 0.5, "color": "gray"})
+            return
         # Plot the frequency count of the patents in descending order for all patents
         plt.figure(figsize=(12, 8))  # You may need to adjust this size depending on the total number of patents
         ax = plt.gca()  # Get current axes
@@ -4,14 +4,31 @@ import os
 
 from utils.fetcher_helper import query_df
 from utils.fetcher_helper import query_img
+from utils.data_store import load_table, load_citation_index, store_file
+from utils.analysis_helper import build_date_lookup, parse_date_column
+from utils.list_index import build_list_index
+from utils.date_index import DateIndex
+from utils.cpc_index import CPCIndex
+from utils.query_planner import PatentQuery
 
 
 class Fetcher:
-    def __init__(self):
-        self.id_index_df = pd.read_csv("data/extract_3k.csv")
-        self.df_basics = pd.read_csv("data/df_basics.csv")
-        self.df_classifications = pd.read_csv("data/patent_classification.csv")
-        self.edge_list = pd.read_csv("data/edge_list.csv")
+    def __init__(self, data_path="data", basic_columns=None):
+        """
+        Point to the patent data. The columnar files written by utils.data_store.convert_to_store are used when they exist.
+        Nothing is read until a table is accessed, and each table is loaded only once.
+        
+        Args:
+            data_path (str, optional) : folder containing the patent data. Defaults to "data".
+            basic_columns (list, optional) : columns of df_basics to load, e.g. leave out the free text columns. Defaults to all the columns.
+        """
+        self.data_path = data_path
+        self.basic_columns = basic_columns
+        self._tables = {}
+        self._citation_index = None
+        self._list_indexes = {}
+        self._cpc_index = None
+        self._date_index = None
 
         self.method_map = {
             "datePublished": self._subset_by_date,
@@ -24,6 +41,36 @@ class Fetcher:
             "cpcInventiveFlattened": self._subset_with_list
         }
     
+    def _load(self, name, columns=None):
+        if name not in self._tables:
+            self._tables[name] = load_table(name, columns=columns, data_path=self.data_path)
+        return self._tables[name]
+
+    @property
+    def df_basics(self):
+        return self._load("df_basics", columns=self.basic_columns)
+
+    @property
+    def id_index_df(self):
+        return self._load("extract_3k")
+
+    @property
+    def edge_list(self):
+        return self._load("edge_list")
+
+    @property
+    def df_classifications(self):
+        return self._load("patent_classification")
+
+    @property
+    def date_index(self):
+        """
+        The sorted index over datePublished, built on first access. The dates are parsed once, the base dataframe is never modified afterwards.
+        """
+        if self._date_index is None:
+            self._date_index = DateIndex(self.df_basics["datePublished"])
+        return self._date_index
+    
     def get_basics(self, ids):
         """
         With the ids given, return the basic information of the patent. If no ids are given, return the whole dataframe.
@@ -54,6 +101,17 @@ class Fetcher:
         print(index_list)
         query_img(index_list, output_folder)
         
+    @property
+    def citation_index(self):
+        """
+        The CSR index over the edge list, loaded from the store or built on first access.
+        """
+        if self._citation_index is None:
+            # the edge list is only read when there is no saved index
+            saved = os.path.exists(store_file("citation_index", self.data_path, extension="npz"))
+            self._citation_index = load_citation_index(data_path=self.data_path, edge_list=None if saved else self.edge_list)
+        return self._citation_index
+        
     def get_citations(self, patent_id):
         """
         With patent id given, return the list of cited patent ids.
@@ -64,7 +122,7 @@ class Fetcher:
         Returns:
             list : list of cited patent ids
         """
-        return self.edge_list[self.edge_list['child'] == patent_id]['parent'].to_list()
+        return self.citation_index.citations(patent_id)
     
     def get_cited_by(self, patent_id):
         """With patent id given, return the list of patents that cited the patent.
@@ -75,9 +133,75 @@ class Fetcher:
         Returns:
             list : list of patents that cited the patent
         """
-        return self.edge_list[self.edge_list['parent'] == patent_id]['child'].to_list()
+        return self.citation_index.cited_by(patent_id)
 
-    def subset_patents(self, column_name, requirements):
+    def get_citation_network(self, ids, direction="citations", depth=1, date_range=None, max_results=None):
+        """
+        With patent ids given, return the patents within a number of citation hops.
+        
+        Args:
+            ids (list) : list of seed patent ids
+            direction (str) : "citations" (the patents cited, backward in time), "cited_by" (the citing patents, forward in time) or "both"
+            depth (int) : number of hops, None for no limit
+            date_range (tuple) : only keep and expand the patents published in the range e.g. ("2000-01-01", "2010-12-31")
+            max_results (int) : stop once this many patents are found
+            
+        Returns:
+            pd.DataFrame : the guid and the depth of the patents found
+        """
+        if date_range is not None and self.citation_index.node_dates is None:
+            self.citation_index.attach_dates(build_date_lookup(self.df_basics))
+        return self.citation_index.traverse(ids, direction, depth, date_range, max_results)
+    
+    def get_citation_path(self, source_id, target_id, direction="citations", max_depth=None):
+        """
+        Return the shortest citation lineage between two patents.
+        
+        Args:
+            source_id (str) : patent id to start from
+            target_id (str) : patent id to reach
+            direction (str) : "citations", "cited_by" or "both"
+            max_depth (int) : number of hops, None for no limit
+            
+        Returns:
+            list : the patent ids from source to target, empty if there is no path
+        """
+        return self.citation_index.path(source_id, target_id, direction, max_depth)
+    
+    def count_descendants(self, ids, max_depth=None, date_range=None, max_results=None):
+        """
+        Count the patents that cite each patent directly or indirectly.
+        
+        Args:
+            ids (list) : list of patent ids
+            max_depth (int) : number of hops, None for no limit
+            date_range (tuple) : only count and expand the patents published in the range e.g. ("2000-01-01", "2010-12-31")
+            max_results (int) : stop counting a patent's descendants once this many are found
+            
+        Returns:
+            pd.Series : the number of descendants indexed by patent id
+        """
+        if date_range is not None and self.citation_index.node_dates is None:
+            self.citation_index.attach_dates(build_date_lookup(self.df_basics))
+        return self.citation_index.count_reachable(ids, "cited_by", max_depth, date_range, max_results)
+
+    def list_index(self, column_name, casefold=False):
+        """
+        The inverted index of a list column, built on first access.
+        
+        Args:
+            column_name (str) : name of the column e.g. "inventorsName" or "inventorState"
+            casefold (bool) : the case insensitive index instead of the case sensitive one. Defaults to False.
+            
+        Returns:
+            ListIndex : the index
+        """
+        key = (column_name, casefold)
+        if key not in self._list_indexes:
+            self._list_indexes[key] = build_list_index(self.df_basics, column_name, casefold)
+        return self._list_indexes[key]
+
+    def subset_patents(self, column_name, requirements, match="contains", how="any", casefold=False):
         """
         Subset the patents based on the column name and range.
         The options are "datePublished", "inventorsName", "inventorCity", "inventorState", "assigneeName", "assigneeCity", "assigneeState", "cpcInventiveFlattened".
@@ -85,6 +209,9 @@ class Fetcher:
         Args:
             column_name (str) : name of the column e.g. "datePublished" or "inventorsName"
             range (tuple) or names (list): range of the column or list of the names e.g. ("2010-01-01", "2011-01-01") or ["Richard L.", "Marshfield"]
+            match (str) : for the list columns, "exact", "prefix" or "contains". Defaults to "contains", which scans all the distinct values; "exact" and "prefix" are much faster.
+            how (str) : for the list columns, "any" to keep the patents matching one of the names, "all" for the patents matching all of them. Defaults to "any".
+            casefold (bool) : for the list columns, match regardless of the case. Defaults to False.
             
         Returns:
             df_subset (dataframe) : the subset of the patents
@@ -93,8 +220,20 @@ class Fetcher:
             raise ValueError(f"Column name {column_name} is not in the options.")
         
         subset_method = self.method_map[column_name]
+        if subset_method == self._subset_with_list:
+            return subset_method(column_name, requirements, match=match, how=how, casefold=casefold)
         return subset_method(column_name, requirements)
         
+    def query(self):
+        """
+        Start a query combining several filters, evaluated in one pass once run() is called.
+        e.g. fetcher.query().cpc(["F41A"]).published("2000-01-01", "2010-12-31").where("inventorState", ["CT"]).select(["guid"]).run()
+        
+        Returns:
+            PatentQuery : the query
+        """
+        return PatentQuery(self)
+        
     def _subset_by_date(self, column_name, requirements, df=None):
         """
         Subset the patents based on the datePublished column.
@@ -108,54 +247,63 @@ class Fetcher:
         start, end = requirements
         
         if df is None:
-            df = self.df_basics
-        df["datePublished"] = df["datePublished"].astype(str)
-        df["datePublished"] = pd.to_datetime(df["datePublished"].str[:10])
-        df_subset = df[(df['datePublished'] >= start) & (df['datePublished'] <= end)]
+            rows = self.date_index.range(start, end)
+            return self.df_basics.iloc[rows].assign(datePublished=self.date_index.dates[rows])
+        dates = parse_date_column(df["datePublished"])
+        mask = (dates >= start) & (dates <= end)
+        df_subset = df[mask].assign(datePublished=dates[mask])
         return df_subset
     
-    def _subset_with_list(self, column_name, requirements, df=None):
+    def _subset_with_list(self, column_name, requirements, df=None, match="contains", how="any", casefold=False):
         """
         Subset the patents based on the column name and list.
+        The inverted index of the column is used, unless another dataframe is given.
         
         Args:
             column_name (str) : name of the column e.g. "inventorsName" or "inventorState"
             requirements (list) : list of the information to subset e.g. ["Richard L.", "Marshfield"] or ["CT", "MA"]
+            match (str) : "exact", "prefix" or "contains". Defaults to "contains", which scans all the distinct values; "exact" and "prefix" are much faster.
+            how (str) : "any" (union) or "all" (intersection). Defaults to "any".
+            casefold (bool) : match regardless of the case. Defaults to False.
             
         Returns:
             df_subset (dataframe) : the subset of the patents
         """
-        
-        if df is None:
-            df = self.df_basics
-        
         if column_name not in self.method_map:
             raise ValueError(f"Column name {column_name} is not in the options.")
         
-        df_subset = df[df[column_name].apply(lambda x: any(item in str(x) for item in requirements))] 
+        if df is None:
+            rows = self.list_index(column_name, casefold).lookup(requirements, match=match, how=how)
+            return self.df_basics.iloc[rows]
+        
+        if casefold:
+            requirements = [item.casefold() for item in requirements]
+            df_subset = df[df[column_name].apply(lambda x: any(item in str(x).casefold() for item in requirements))]
+        else:
+            df_subset = df[df[column_name].apply(lambda x: any(item in str(x) for item in requirements))] 
         
         return df_subset
 
+    @property
+    def cpc_index(self):
+        """
+        The composite key index over the cpc classifications, built on first access.
+        """
+        if self._cpc_index is None:
+            self._cpc_index = CPCIndex(self.df_classifications)
+        return self._cpc_index
+
     def filter_patents_by_cpc(self, cpc_codes):
         """
-        Filter the patent ids by the cpc codes.
+        Filter the patent ids by the cpc codes. All the codes are looked up in one batch.
         
         Args:
-            cpc_codes (list of list) : list of cpc codes e.g. [["F41","A","3","58"], ["F41", "C", "3", "14"]]
+            cpc_codes (list) : list of cpc codes or prefixes e.g. [["F41","A","3","58"], ["F41", "C", "3", "14"]] or ["F41A", "F41C3/14"]
         
         Returns:
-            ids (list) : the ids of the patents subsetted
+            ids (np.ndarray) : the deduplicated ids of the patents subsetted
         """
-        ids = []
-        for cpc_list in cpc_codes:
-            df_to_subset = self.df_classifications
-            for index, cpc in enumerate(cpc_list):
-                if index > 1:
-                    cpc = np.float64(cpc)
-                df_to_subset = df_to_subset[df_to_subset[f"{index}"] == cpc]
-            ids.extend(df_to_subset['4'].to_list())
-        
-        return ids
+        return self.cpc_index.lookup(cpc_codes)
     
 def export_to_temp(df, filename):
     """
@@ -198,8 +346,8 @@ if __name__ == "__main__":
     print("-------------------")
     
     requirements = ["ITT Corporation"]
-    print(len(fetcher.subset_patents("assigneeName", requirements)))
-    print(fetcher.subset_patents("assigneeName", requirements))
+    print(len(fetcher.subset_patents("assigneeName", requirements, match="exact")))
+    print(fetcher.subset_patents("assigneeName", requirements, match="exact"))
     print("-------------------")
     
     requirements = [["F41","A","3"], ["F41", "C", "3", "14"]]
@@ -2,22 +2,46 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import ast
+import os
 from collections import Counter
 import matplotlib.ticker as ticker
 
-def reformat(data):
+from utils.list_helper import LIST_COLUMNS, is_decoded, decode_list_column, decode_cpc_column, explode_list_column, fingerprint, save_decoded_columns, load_decoded_columns
+from utils.cpc_index import split_cpc_column
+
+REFORMAT_COLUMNS = LIST_COLUMNS + ['cpcInventiveFlattened', 'datePublished', 'applicationFilingDate']
+# clean up of the inventorState and assigneeState values: typos and non-US states
+STATE_REPLACEMENTS = {
+    "CA 91106": "CA",
+    "MT 59829": "MT",
+    "N/A": pd.NA,
+    "NB": pd.NA,
+    "PR": pd.NA,
+    "CH": pd.NA,
+    "GB2": pd.NA,
+    "Attorney at Law 1041": pd.NA,
+    "US": pd.NA
+}
+
+def reformat(data, cache_path=None):
     ''' 
     reformat the dataset to correct datatype. 
     SHOULD be run before any other functions. 
+    cache_path (optional): folder where the converted columns are saved as arrays in a .npz file, keyed by a fingerprint of the dataset,
+    so reformatting the same dataset again only reads them back.
     '''
+    if cache_path is not None:
+        cache_file = os.path.join(cache_path, f"reformat_{fingerprint(data, REFORMAT_COLUMNS)}.npz")
+        if os.path.exists(cache_file):
+            return load_decoded_columns(cache_file, data)
     try: # transform city, name, state into list
-        for col in ['inventorsName', 'inventorCity', 'inventorState', 'assigneeName', 'assigneeCity', 'assigneeState']:
-            data[col] = data[col].apply(convert_string_to_list)
+        for col in LIST_COLUMNS:
+            data[col] = decode_list_column(data[col])
     except KeyError:
         pass
     try: # convert cpcInventiveFlattened into list
-        data['cpcInventiveFlattened'] = data['cpcInventiveFlattened'].str.replace(r"[\[\]']", "", regex=True)
-        data['cpcInventiveFlattened'] = data['cpcInventiveFlattened'].apply(lambda x: x.split(';') if pd.notna(x) else x)
+        if not is_decoded(data['cpcInventiveFlattened']):
+            data['cpcInventiveFlattened'] = decode_cpc_column(data['cpcInventiveFlattened'])
     except KeyError:
         pass
     try: # convert datePublished, applicationFilingDate into datetime
@@ -25,10 +49,12 @@ def reformat(data):
         data['applicationFilingDate'] = pd.to_datetime(data['applicationFilingDate'], errors = 'coerce')
     except KeyError:
         pass
+    if cache_path is not None:
+        save_decoded_columns(cache_file, data, LIST_COLUMNS + ['cpcInventiveFlattened'], ['datePublished', 'applicationFilingDate'])
     return data
 
 
-def clean_by(data, column):
+def clean_by(data, column, compact = False, keep = None):
     """
     Clean the dataset based on a column.
     This function cleans the dataset based on the columns about demographic data, including:
@@ -38,9 +64,20 @@ def clean_by(data, column):
     input:
         data (pd.DataFrame): The dataset to clean.
         column (str): The name of the column to clean. It can be inventorState or assigneeState.
+        compact (bool): Whether to return only the row_id of each value in data and the value, as a categorical
+            (integer codes plus one dictionary), instead of copying every column for each value. Default is False.
+        keep (list): Other columns of data to add to the compact result e.g. ['datePublished']. Default is None.
     output:
         pd.DataFrame: The cleaned dataset. Usually, it has more rows than the original dataset.
     """
+    if compact:
+        replacements = STATE_REPLACEMENTS if column in ["inventorState", "assigneeState"] else None
+        row_ids, values = explode_list_column(data[column], replacements)
+        new_set = pd.DataFrame({'row_id': row_ids})
+        for col in keep or []:
+            new_set[col] = data[col].to_numpy()[row_ids]
+        new_set[column] = values
+        return new_set
     # Clean square brackets and single quotes
     # data[column] = data[column].str.replace(r"[\[\]']", "", regex=True)
     # Expand the column into multiple rows split by ', '
@@ -49,22 +86,42 @@ def clean_by(data, column):
     new_set = new_set.explode(column).reset_index(drop=True)
     if column in ["inventorState", "assigneeState"]:
         # Clean specific states and remove duplicates and non-US states
-        replacements = {
-            "CA 91106": "CA",
-            "MT 59829": "MT",
-            "N/A": pd.NA,
-            "NB": pd.NA,
-            "PR": pd.NA,
-            "CH": pd.NA,
-            "GB2": pd.NA,
-            "Attorney at Law 1041": pd.NA,
-            "US": pd.NA
-        }
-        new_set[column] = new_set[column].replace(replacements)
+        new_set[column] = new_set[column].replace(STATE_REPLACEMENTS)
     return new_set
 
+def plot_frequency(frequency_table, column, title, num = 5, rotation = 45, figsize = (10, 6), color = 'hotpink',
+                   plotter = None, name = None):
+    ''' 
+    Draw the bar plot of the top n rows of a frequency table.
+    inputs:
+        frequency_table (pd.DataFrame): The frequency table, with the columns column and 'Frequency'.
+        column (str): The name of the counted column.
+        title (str): The title of the plot.
+        num (int): The top n values to display in the plot. Default is 5.
+        rotation (int): The rotation of the x-axis labels in the plot. Default is 45.
+        figsize (tuple): The size of the plot. Default is (10, 6).
+        color (str): The color of the bars in the plot. Default is 'hotpink'.
+        plotter (Plotter): Add the chart to this plotter, rendered later into a file, instead of showing it. Default is None.
+        name (str): The name of the chart in the plotter. Default is None, using the title.
+    '''
+    if plotter is not None:
+        top = frequency_table.iloc[:num]
+        if len(top) == 0:
+            raise TypeError("no data to plot")
+        plotter.add(name or title, 'bar', pd.Series(top['Frequency'].to_numpy(), index=top[column].astype(str)),
+                    title = title, xlabel = column, ylabel = 'Frequency', rotation = rotation, figsize = figsize, color = color)
+        return
+    plt.figure(figsize=figsize)
+    frequency_table.iloc[:num].plot(x= column, y = 'Frequency', kind='bar', color = color)
+    plt.title(title)
+    plt.xlabel(column)
+    plt.xticks(rotation = rotation, ha='right', fontsize=10)
+    plt.ylabel('Frequency')
+    plt.tight_layout()
+    plt.show()
+
 def frequency(data, column, graph = True, num = 5, rotation = 45,
-                descending = True, figsize = (10, 6), color = 'hotpink'):
+                descending = True, figsize = (10, 6), color = 'hotpink', plotter = None):
     """
     Generate a frequency table for a column.
     This function generates a frequency table for a column.
@@ -78,6 +135,7 @@ def frequency(data, column, graph = True, num = 5, rotation = 45,
         descending (bool): Whether to sort the frequency table in descending order. Default is True.
         figsize (tuple): The size of the plot. Default is (10, 6).
         color (str): The color of the bars in the plot. Default is 'hotpink'.
+        plotter (Plotter): Add the plot to this plotter (see utils.plotter) instead of showing it. Default is None.
     output:
         pd.DataFrame: The frequency table for the column.
     """
@@ -89,29 +147,54 @@ def frequency(data, column, graph = True, num = 5, rotation = 45,
         word_counts = Counter(all_words)
         frequency_table = pd.DataFrame(word_counts.items(), columns=[column, 'Frequency']).sort_values(by='Frequency', ascending=False).reset_index(drop=True)
     else: 
-        frequency_table = data[column].value_counts().sort_values(ascending=(not descending)).reset_index()
+        counts = data[column].value_counts()
+        if isinstance(data[column].dtype, pd.CategoricalDtype): # counted on the codes, drop the unused categories
+            counts = counts[counts > 0]
+        frequency_table = counts.sort_values(ascending=(not descending)).reset_index()
         frequency_table.columns = [column, 'Frequency']
     # Display the frequency table
     print(f"Frequency table for '{column}':")
     print(frequency_table.head(num))
     # Plot the frequency distribution
     if graph: 
-        plt.figure(figsize=figsize)
-        frequency_table.iloc[:num].plot(x= column, y = 'Frequency', kind='bar', color = color)
-        plt.title(f'Frequency Distribution of {column}')
-        plt.xlabel(column)
-        plt.xticks(rotation = rotation, ha='right', fontsize=10)
-        plt.ylabel('Frequency')
-        plt.tight_layout()
-        plt.show()
+        plot_frequency(frequency_table, column, f'Frequency Distribution of {column}',
+                       num = num, rotation = rotation, figsize = figsize, color = color,
+                       plotter = plotter, name = f'frequency_{column}')
     return frequency_table
 
+def group_frequency(data, group, target, num = None, descending = True):
+    ''' 
+    Count the values of a target variable within every group, in one pass over the dataset.
+    If the target is 'keyword', the keywords of the lists are counted.
+    inputs:
+        data (pd.DataFrame): The dataset to analyze.
+        group (str): The name of the column to group by.
+        target (str): The name of the column to analyze.
+        num (int): Keep only the top n values of each group. Default is None, keeping all of them.
+        descending (bool): Whether to sort the frequencies in descending order. Default is True.
+    output:
+        pd.DataFrame: One row per group and value, with the columns group, target and 'Frequency', sorted by group then frequency.
+    '''
+    if group not in data or target not in data:
+        raise ValueError(f"One or both columns '{group}' and '{target}' do not exist in the DataFrame.")
+    pairs = data[[group, target]]
+    if target == 'keyword':
+        pairs = pairs.explode(target)
+    counts = pairs.groupby(group, observed=True)[target].value_counts().rename('Frequency').reset_index()
+    # a categorical target gets a row for every category in every group, drop the unused ones
+    counts = counts[counts['Frequency'] > 0]
+    counts = counts.sort_values([group, 'Frequency'], ascending=[True, not descending], kind='stable')
+    if num is not None:
+        counts = counts.groupby(group, observed=True).head(num)
+    return counts.reset_index(drop=True)
+
 def freq_by_group(data, group, target, graph = True, rotation = 45,
-                    num = 5, figsize = (10, 6), color = 'tomato', 
-                    descending = True):
+                num = 5, figsize = (10, 6), color = 'tomato', 
+                descending = True, plotter = None):
     ''' 
     Draw the frequency distribution of a target variable by a group variable. 
     Default is to draw bar plots.
+    The frequencies of all the groups are computed at once by group_frequency.
     inputs:
         data (pd.DataFrame): The dataset to analyze.
         group (str): The name of the column to group by.
@@ -122,35 +205,26 @@ def freq_by_group(data, group, target, graph = True, rotation = 45,
         figsize (tuple): The size of the plot. Default is (10, 6).
         color (str): The color of the bars in the plot. Default is 'tomato'.
         descending (bool): Whether to sort the frequency table in descending order. Default is True.
+        plotter (Plotter): Add the plots to this plotter (see utils.plotter) instead of showing one figure per group. Default is None.
     output: list. A list of frequency tables for each group.
     '''
-    # Check if the columns exist in the DataFrame
-    if group not in data or target not in data:
-        raise ValueError(f"One or both columns '{group}' and '{target}' do not exist in the DataFrame.")
-    grouped = data.groupby(group)  # Group the dataframe by the specified column
+    counts = group_frequency(data, group, target, descending = descending)
+    tables = {group_name: table for group_name, table in counts.groupby(group, observed=True, sort=False)}
     frequency_tables = []  # List to store frequency tables
-    for group_name, group_df in grouped:
-        if target == 'keyword':
-            all_words = [word for sublist in group_df['keyword'] if sublist is not pd.NA for word in sublist]
-            word_counts = Counter(all_words)
-            frequency_table = pd.DataFrame(word_counts.items(), columns=[target, 'Frequency']).sort_values(by='Frequency', ascending=False).reset_index(drop=True)
-        else: 
-            frequency_table = data[target].value_counts().sort_values(ascending=(not descending)).reset_index()
-            frequency_table.columns = [target, 'Frequency']
+    for group_name in data.groupby(group, observed=True).size().index:
+        if group_name in tables:
+            frequency_table = tables[group_name][[target, 'Frequency']].reset_index(drop=True)
+        else:
+            frequency_table = pd.DataFrame(columns=[target, 'Frequency'])
         print(f"Frequency table for '{target}' by '{group}': {group_name}")
         print(frequency_table.head(num))
         frequency_tables.append(frequency_table)
         
         if graph: 
             try: 
-                plt.figure(figsize=figsize)
-                frequency_table.iloc[:num].plot(x= target, y = 'Frequency', kind='bar', color = color)
-                plt.title(f'Frequency Distribution of {target} for {group_name}')
-                plt.xlabel(target)
-                plt.xticks(rotation = rotation, ha='right', fontsize=10)
-                plt.ylabel('Frequency')
-                plt.tight_layout()
-                plt.show()
+                plot_frequency(frequency_table, target, f'Frequency Distribution of {target} for {group_name}',
+                               num = num, rotation = rotation, figsize = figsize, color = color,
+                               plotter = plotter, name = f'freq_by_group_{target}_{group}_{group_name}')
             except TypeError:
                 print(f"No data available for '{group_name}'")
                 continue
@@ -163,12 +237,11 @@ def separate_category(data):
         data (pd.DataFrame): The dataset to separate.
     output:
         pd.DataFrame: The dataset with cpcInventiveFlattened separated into multiple columns and rows.
+            category, subcategory1 and subcategory2 are categoricals (e.g. 'F', '41', 'A'), subcategory3 and subcategory4 are integers.
     '''
     data = data.explode('cpcInventiveFlattened').reset_index(drop=True)
-    pattern = r'([A-Z])(\d+)([A-Z])(\d+)/(\d+)'
-    # Extract the parts of the CPC code using the defined pattern
-    cpc_parts = data['cpcInventiveFlattened'].str.extract(pattern)
-    cpc_parts.columns = ['category', 'subcategory1', 'subcategory2', 'subcategory3', 'subcategory4']
+    # Extract the parts of the CPC code, once per distinct code
+    cpc_parts = split_cpc_column(data['cpcInventiveFlattened'])
     # Concatenate the original DataFrame with the new columns
     data = pd.concat([data, cpc_parts], axis=1)
     return data
@@ -191,7 +264,7 @@ def dummy_by_time(data, column, cutoff, dummy = 'dummy'):
     data[dummy] = (data[column] < cutoff).astype(int)
     return data
 
-def first_appear(data, target, graph = True, figsize = (10, 6), color = 'lightgreen'):
+def first_appear(data, target, graph = True, figsize = (10, 6), color = 'lightgreen', plotter = None):
     ''' 
     Generate a bar plot of the first appearance of target column.
     input:
@@ -200,6 +273,7 @@ def first_appear(data, target, graph = True, figsize = (10, 6), color = 'lightgr
         graph (bool): Whether to generate a line plot. Default is True.
         figsize (tuple): The size of the plot. Default is (10, 6).
         color (str): The color of the bars in the plot. Default is 'lightgreen'.
+        plotter (Plotter): Add the plot to this plotter (see utils.plotter) instead of showing it. Default is None.
     output:
         pd.DataFrame: The first appearance of target column.
     '''
@@ -209,7 +283,10 @@ def first_appear(data, target, graph = True, figsize = (10, 6), color = 'lightgr
     first_appear['Year'] = first_appear['FirstAppearance'].dt.year
     counts = first_appear.groupby('Year').size()
     print(counts)
-    if graph: 
+    if graph and plotter is not None:
+        plotter.add(f'first_appear_{target}', 'line', counts, title = 'First Appearance of ' + target + ' Over Time',
+                    xlabel = 'Year', ylabel = 'Frequency', figsize = figsize, color = color, locator = 15)
+    elif graph: 
         plt.figure(figsize=figsize)
         counts.plot(kind='line', color=color)
         plt.title('First Appearance of ' + target + ' Over Time')
@@ -226,6 +303,8 @@ def convert_string_to_list(value):
     '''Convert string to list using ast.literal_eval if applicable
     HELPER function with reformat
     '''
+    if isinstance(value, list):
+        return value
     if pd.isna(value):  
         return value  
     try:
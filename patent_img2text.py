@@ -3,8 +3,12 @@ import requests
 import time
 import platform
 import os
-from tqdm import trange
+from tqdm import tqdm
 from utils.vision_img import API_calling
+from utils.vision_pipeline import ExtractionPipeline
+from utils.result_store import ResultStore
+from utils.downloader import Downloader
+from utils.download_manifest import DownloadManifest
 
 class TextExtract:
     def __init__(self):
@@ -12,6 +16,7 @@ class TextExtract:
         self.id_cname = None
         self.df_task = None
         self.failed_list = []
+        self.download_report = None
         self.id_todo = None
         self.refined_csv = pd.read_csv('data/refined.csv') if os.path.exists("data/refined.csv") else None
         
@@ -31,6 +36,10 @@ class TextExtract:
         self.raw_response = []
         self.refined_response = []
         self.failed_list_api = []
+        # responses up to these positions are already in the result store
+        self.raw_saved = 0
+        self.refined_saved = 0
+        self.store = ResultStore("data/results")
         
         
     def load_df(self, id_path, url_path, id_cname='guid'):
@@ -51,53 +60,59 @@ class TextExtract:
         
     def preperation(self):
         # Select a header based on the system
-        if self.system == 'Darwin':
-            headers = self.headers_mac
-        elif self.system == 'Windows':
+        if self.system == 'Windows':
             headers = self.headers_windows
+        else:
+            headers = self.headers_mac
             
         # Create a folder to store the images if not exist
         if not os.path.exists("images"):
             os.makedirs("images")
             print(f"The directory 'images' was created.")
+        return headers
     
-    def download_img(self, start_index=0, end_index=None, t_wait=0.5):
+    def download_img(self, start_index=0, end_index=None, t_wait=0.5, max_workers=8, retries=3,
+                     manifest_path="data/intermediate/download_manifest.sqlite", verify=False):
         '''
         To download the images from the urls in the df_task
+        The images are downloaded concurrently; the request rate stays at most one every t_wait seconds on average.
+        A failed image is retried, then recorded in failed_list and download_report, and does not stop the others.
+        Every download is recorded in the manifest: a restart skips the images already downloaded and resumes the partial ones.
         
         Parameters:
             start_index (int): the index of the first row to download
             end_index (int): the index of the last row to download
-            t_wait (float): the time to wait between each download
+            t_wait (float): the average time between two requests, 0 for no throttling
+            max_workers (int): the number of concurrent downloads (optional, default=8)
+            retries (int): the number of retries of a failed download (optional, default=3)
+            manifest_path (str): the SQLite file of the manifest, None to download without it
+                (optional, default="data/intermediate/download_manifest.sqlite")
+            verify (bool): check the checksum of the images already downloaded before skipping them (optional, default=False)
         '''
         if end_index is None:
             end_index = len(self.df_task)
         
-        self.preperation()
-        try:
-            for i in range(start_index, end_index):
-                curr_id = self.df_task.loc[i, self.id_cname]
-                curr_i = i
-                img_url = self.df_task.loc[i, 'url']
-            
-                response = requests.get(img_url, headers=headers)
-                
-                if response.status_code == 200:
-                    file_path = "images/" + str(i) + ".tif"
-            
-                    # Open the file in binary write mode and save the image
-                    with open(file_path, 'wb') as file:
-                        file.write(response.content)
-            
-                    print(f"Image downloaded successfully and saved to {file_path}")
-                    time.sleep(t_wait)
-                else:
-                    print(f"Failed to download the image. Status code: {response.status_code}")
-                    self.failed_list.append(i)
-                    break
-        except:
-            print(self.failed_list)
+        headers = self.preperation()
+        indexes = list(range(start_index, end_index))
+        jobs = [(self.df_task.loc[i, 'url'], "images/" + str(i) + ".tif") for i in indexes]
+        manifest = DownloadManifest(manifest_path) if manifest_path is not None else None
+        if manifest is not None and verify:
+            corrupted = manifest.verify([path for _, path in jobs])
+            print("Corrupted images downloaded again:", len(corrupted))
+        rate = 1 / t_wait if t_wait > 0 else None
+        downloader = Downloader(headers=headers, max_workers=max_workers, rate=rate, retries=retries, manifest=manifest)
+        results = downloader.download(jobs)
+        if manifest is not None:
+            manifest.close()
+        
+        self.download_report = pd.DataFrame(results, index=indexes)
+        failed = self.download_report[self.download_report['status'] == 'failed']
+        self.failed_list.extend(failed.index.to_list())
+        for i, row in failed.iterrows():
+            print(f"Failed to download the image {i}: {row['error']}")
         print("Done!")
+        print("Downloaded:", (self.download_report['status'] == 'done').sum())
+        print("Skipped (already downloaded):", (self.download_report['status'] == 'skipped').sum())
         print("Failed list:", self.failed_list)
 
     def get_index_df(self, id_list):
@@ -108,90 +123,107 @@ class TextExtract:
         print(index_df.head())
         return index_df
 
-    def get_info(self, id_list=None, start_index=0):
+    def get_info(self, id_list=None, start_index=0, max_workers=4, rpm=60, tpm=None, checkpoint_every=20, compact=False):
+        '''
+        To extract the title, authors, date and city of the patents from their page images with the vision API
+        The images of the next patents are encoded while the requests of the previous ones are waiting for an answer,
+        and up to max_workers requests are sent at once within the rate limits.
+        The new responses are checkpointed to the result store every checkpoint_every patents, so a crash loses at most these.
+        
+        Parameters:
+            id_list (list): the ids of the patents (optional, default=the ids from start_index)
+            start_index (int): the position of the first id when id_list is None (optional, default=0)
+            max_workers (int): the number of concurrent requests (optional, default=4)
+            rpm (float): the maximum number of requests per minute, None for no limit (optional, default=60)
+            tpm (float): the maximum number of estimated tokens per minute, None for no limit (optional, default=None)
+            checkpoint_every (int): the number of patents between two checkpoints (optional, default=20)
+            compact (bool): also merge the result store into data/raw.csv and data/refined.csv at the end, which rewrites them;
+                otherwise only the new responses are appended and compact can be called later (optional, default=False)
+        '''
         if id_list is None:
             id_list = self.id_list[start_index:]
 
+        index_df = self.get_index_df(id_list)
+        # Get all images for one patent
+        groups = [(guid, ["images/" + str(x) + ".tif" for x in indexes])
+                  for guid, indexes in index_df.groupby('guid', sort=False)['index']]
+        pipeline = ExtractionPipeline(self.GPT, self.headers, max_workers=max_workers, rpm=rpm, tpm=tpm)
+        progress = tqdm(total=len(groups))
         try:
-            index_df = self.get_index_df(id_list)
-            
-            curr_list = []
-            id_pt = index_df['guid'].iloc[0]
-            for i in trange(1, len(index_df)):
-                if index_df['guid'].iloc[i] != id_pt:
-                    print("curr_id: ", index_df['guid'].iloc[i])
-                    print("prev_id: ", id_pt)
-                    # Get all images for one patent
-                    image_path_list = []
-                    for x in curr_list:
-                        image_path_list.append("images/" + str(x) + '.tif')
-                    # Api Calling
-                    response = self.GPT.get_info(image_path_list, self.headers)
-                    
-                    # Save Data
-                    self.raw_response.append([id_pt, response])
-                    try:
-                        r = response['choices'][0]['message']['content'] # refine the response
-                        self.refined_response.append([id_pt, r]) # append the refined response
-                        print("response: \n", r)
-                    except:
-                        print(response)
-                        print("KeyError occured.", self.failed_list_api)
-                        self.failed_list_api.append(index_df['guid'].iloc[i])
-                        self.refined_response.append([id_pt, "KeyError"]) # append the refined response
-
-                    # Reset the variables
-                    curr_list = []
-                    id_pt = index_df['guid'].iloc[i]
-                    curr_i = i
-                else:
-                    print("curr_id: ", index_df['guid'].iloc[i])
-                    print("appending")
-                    curr_list.append(index_df['index'].iloc[i])
-                    continue
+            pipeline.run(groups, lambda guid, response, error: self.handle_response(guid, response, error, progress, checkpoint_every))
             print("Done!")
-            print("Failed list:", self.failed_list_api)
-            self.save()
         except KeyboardInterrupt:
             print("interrupted.")
+        finally:
+            progress.close()
             print("Failed list:", self.failed_list_api)
-            self.save()
-        
-    def save(self):
-        print("Saving...")
-        print("failed ids: ", self.failed_list_api)
-        if not os.path.exists("data"):
-            os.makedirs("data")
-            print(f"The directory 'data' was created.")
+            self.save(compact=compact)
 
-        # Load if already exists, otherwise create a new one
-        raw_df_new = pd.DataFrame(self.raw_response, columns=['id', 'response'])
-        refined_df_new = pd.DataFrame(self.refined_response, columns=['id', 'response'])
+    def handle_response(self, guid, response, error=None, progress=None, checkpoint_every=None):
+        '''
+        To save the response of the API for one patent
         
+        Parameters:
+            guid (str): the id of the patent
+            response (dict): the json response of the API, None if the request failed
+            error (str): the error of the request (optional, default=None)
+            progress (tqdm): the progress bar to update (optional, default=None)
+            checkpoint_every (int): checkpoint once this many responses are not saved, None to never (optional, default=None)
+        '''
+        self.raw_response.append([guid, response if response is not None else error])
+        try:
+            r = response['choices'][0]['message']['content'] # refine the response
+            self.refined_response.append([guid, r]) # append the refined response
+            print("response: \n", r)
+        except (KeyError, IndexError, TypeError):
+            print(response if response is not None else error)
+            self.failed_list_api.append(guid)
+            print("KeyError occured.", self.failed_list_api)
+            self.refined_response.append([guid, "KeyError"]) # append the refined response
+        if progress is not None:
+            progress.update()
+        if checkpoint_every and len(self.refined_response) - self.refined_saved >= checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        '''
+        To append the responses not saved yet to the result store
+        '''
+        self.store.append(self.raw_response[self.raw_saved:], self.refined_response[self.refined_saved:])
+        self.raw_saved = len(self.raw_response)
+        self.refined_saved = len(self.refined_response)
         
-        if not os.path.exists("data/raw.csv"):
-            print("creating new raw.csv...")
-            raw_df_new.to_csv("data/raw.csv", index=False)
-            print(f"raw.csv was saved.")
-        else:
-            print("loading prev raw.csv...")
-            raw_df = pd.read_csv("data/raw.csv")
-            raw_df_out = pd.concat([raw_df, raw_df_new], ignore_index=True)
-            raw_df_out.to_csv("data/raw.csv", index=False)
+    def save(self, compact=False):
+        '''
+        To save the new responses: they are appended to the result store, and merged into data/raw.csv and data/refined.csv
+        with compact
         
-        if not os.path.exists("data/refined.csv"):
-            print("creating new refined.csv...")
-            refined_df_new.to_csv("data/refined.csv", index=False)
-            print(f"refined.csv was saved.")
-        else:
-            print("loading prev refined.csv...")
-            refined_df = pd.read_csv("data/refined.csv")
-            refined_df_out = pd.concat([refined_df, refined_df_new], ignore_index=True)
-            refined_df_out.to_csv("data/refined.csv", index=False)
+        Parameters:
+            compact (bool): merge the result store into the csv files (optional, default=False)
+        '''
+        print("Saving...")
+        print("failed ids: ", self.failed_list_api)
+        self.checkpoint()
+        if compact:
+            self.compact()
+
+    def compact(self):
+        '''
+        To merge the result store into data/raw.csv and data/refined.csv, replacing them atomically
+        It rewrites both files, so it is meant to be called once in a while (e.g. after a whole extraction), not after every batch
+        '''
+        print("compacting...")
+        merged = self.store.compact()
+        print(f"{merged} responses merged into raw.csv and refined.csv.")
+        if os.path.exists("data/refined.csv"):
+            self.refined_csv = pd.read_csv("data/refined.csv")
 
     def unscraped(self):
         id_list_all = self.df_extract.guid.to_list()
-        id_done = self.refined_csv.id.to_list()
+        # the ids done are those of refined.csv and of the result store not compacted yet
+        id_done = set(self.store.read()[1]['id'])
+        if self.refined_csv is not None:
+            id_done.update(self.refined_csv.id)
         self.id_todo = [item for item in id_list_all if item not in id_done]
         print(len(self.id_todo))
         
@@ -201,7 +233,10 @@ class TextExtract:
         refined_new.to_csv('data/refined.csv', index=False)
 
     def look_up_raw(self):
-        raw = pd.read_csv('data/raw.csv')
+        # raw.csv and the raw responses of the result store not compacted yet
+        raw_new = self.store.read()[0]
+        raw_new['response'] = raw_new['response'].map(str)
+        raw = pd.concat([pd.read_csv('data/raw.csv'), raw_new], ignore_index=True) if os.path.exists('data/raw.csv') else raw_new
         # From the id_todo, get the corresponding response in the raw.csv
         raw_info = raw[raw['id'].isin(self.id_todo)]
         # For the response column, Get rid of the NaN, and any cell with string 'error' in it
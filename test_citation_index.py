@@ -0,0 +1,27 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from utils.citation_index import CitationIndex
+
+
+class TestCitationIndex(unittest.TestCase):
+
+    def setUp(self):
+        # A cites B and C, B cites C, and a blank row as read from edge_list.csv
+        self.edge_list = pd.DataFrame({
+            "child": ["A", "A", "B", np.nan, "D"],
+            "parent": ["B", "C", "C", np.nan, np.nan],
+        })
+
+    def test_from_edge_list_skips_missing_ends(self):
+        index = CitationIndex.from_edge_list(self.edge_list)
+        self.assertEqual(sorted(index.guids), ["A", "B", "C"])
+        self.assertEqual(index.citations("A"), ["B", "C"])
+        self.assertEqual(index.cited_by("C"), ["A", "B"])
+        self.assertEqual(index.citations("C"), [])
+        self.assertEqual(index.citations("D"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
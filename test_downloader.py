@@ -0,0 +1,125 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.downloader import Downloader
+from utils.download_manifest import DownloadManifest
+
+FILES = {f"/img/{i}": bytes(range(256)) * (i + 1) for i in range(6)}
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    # a local stand-in of the image server: files with Range support, an unavailable and a missing path
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get("Range")))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(0.05)
+            if self.path == "/unavailable":
+                self.send_error(503)
+            elif self.path not in FILES:
+                self.send_error(404)
+            else:
+                body, status = FILES[self.path], 200
+                if self.headers.get("Range"):
+                    start = int(self.headers["Range"][len("bytes="):].rstrip("-"))
+                    body, status = body[start:], 206
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDownloader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+        cls.server.lock = threading.Lock()
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests = []
+        self.server.active = 0
+        self.server.max_active = 0
+        self.folder = tempfile.mkdtemp()
+        self.manifest = DownloadManifest(os.path.join(self.folder, "manifest.sqlite"))
+
+    def tearDown(self):
+        self.manifest.close()
+        shutil.rmtree(self.folder)
+
+    def downloader(self, **kwargs):
+        return Downloader(max_workers=4, rate=None, backoff=0, manifest=self.manifest, **kwargs)
+
+    def jobs(self, paths):
+        return [(self.base + path, os.path.join(self.folder, f"{i}.tif")) for i, path in enumerate(paths)]
+
+    def test_concurrent_download(self):
+        jobs = self.jobs(FILES)
+        results = self.downloader().download(jobs)
+        self.assertEqual([result["status"] for result in results], ["done"] * len(jobs))
+        for (url, path), body in zip(jobs, FILES.values()):
+            with open(path, "rb") as file:
+                self.assertEqual(file.read(), body)
+        self.assertGreater(self.server.max_active, 1)
+        self.assertEqual(self.manifest.report(), {"done": len(jobs)})
+
+    def test_resume_partial_file(self):
+        [(url, path)] = self.jobs(["/img/5"])
+        body = FILES["/img/5"]
+        with open(path + ".part", "wb") as file:
+            file.write(body[:500])
+        [result] = self.downloader().download([(url, path)])
+        self.assertEqual(result["status"], "done")
+        self.assertEqual(self.server.requests, [("/img/5", "bytes=500-")])
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), body)
+        self.assertFalse(os.path.exists(path + ".part"))
+        self.assertEqual(result["size"], len(body))
+
+    def test_failures_are_recorded(self):
+        jobs = self.jobs(["/unavailable", "/missing", "/img/0"])
+        unavailable, missing, found = self.downloader(retries=2).download(jobs)
+        self.assertEqual((unavailable["status"], unavailable["status_code"], unavailable["attempts"]), ("failed", 503, 3))
+        self.assertEqual((missing["status"], missing["status_code"], missing["attempts"]), ("failed", 404, 1))
+        self.assertEqual(found["status"], "done")
+        self.assertEqual(self.manifest.get(jobs[0][1])["status"], "failed")
+        self.assertEqual(self.manifest.get(jobs[1][1])["status"], "failed")
+
+    def test_malformed_url_is_not_retried(self):
+        [result] = Downloader(rate=None, backoff=60, retries=3).download([("nan", os.path.join(self.folder, "nan.tif"))])
+        self.assertEqual((result["status"], result["attempts"]), ("failed", 1))
+
+    def test_restart_skips_done_files(self):
+        jobs = self.jobs(["/img/1", "/img/2", "/missing"])
+        self.downloader().download(jobs)
+        self.server.requests = []
+        results = self.downloader().download(jobs)
+        self.assertEqual([result["status"] for result in results], ["skipped", "skipped", "failed"])
+        self.assertEqual(self.server.requests, [("/missing", None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import time
+import base64
+import shutil
+import tempfile
+import threading
+import unittest
+import pandas as pd
+
+from patent_img2text import TextExtract
+
+
+class StubResponse:
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class TestGetInfo(unittest.TestCase):
+
+    def setUp(self):
+        # TextExtract works with paths relative to the working directory
+        self.cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        os.chdir(self.folder)
+        os.makedirs("data")
+        os.makedirs("images")
+        # one page per patent, its content is the guid so that the stub knows which patent it answers
+        self.guids = [f"US-{i:07d}-A" for i in range(12)]
+        pd.DataFrame({"index": range(len(self.guids)), "guid": self.guids}).to_csv("data/extract_3k.csv", index=False)
+        self.missing_images = self.guids[0]
+        self.api_error = self.guids[1]
+        for index, guid in enumerate(self.guids):
+            if guid != self.missing_images:
+                with open(f"images/{index}.tif", "wb") as file:
+                    file.write(guid.encode())
+
+        self.extractor = TextExtract()
+        self.post_times = []
+        self.lock = threading.Lock()
+        self.extractor.GPT.post = self.post
+        self.appended = []
+        append = self.extractor.store.append
+        self.extractor.store.append = lambda raw, refined: self.appended.append(len(refined)) or append(raw, refined)
+
+    def tearDown(self):
+        self.extractor.GPT.session.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+
+    def post(self, payload, headers):
+        with self.lock:
+            self.post_times.append(time.monotonic())
+        image_url = payload["messages"][0]["content"][1]["image_url"]["url"]
+        guid = base64.b64decode(image_url.split(",", 1)[1]).decode()
+        if guid == self.api_error:
+            return StubResponse(400, {"error": {"message": "invalid image"}})
+        return StubResponse(200, {"choices": [{"message": {"content": f"Title: {guid}"}}]})
+
+    def test_get_info(self):
+        rpm, max_workers = 600, 4
+        self.extractor.get_info(self.guids, max_workers=max_workers, rpm=rpm, checkpoint_every=3)
+
+        # the failures are recorded without stopping the others
+        self.assertCountEqual(self.extractor.failed_list_api, [self.missing_images, self.api_error])
+        refined = dict(self.extractor.refined_response)
+        self.assertEqual(len(refined), len(self.guids))
+        for guid in self.guids[2:]:
+            self.assertEqual(refined[guid], f"Title: {guid}")
+
+        # the rpm limit holds, after a burst of max_workers requests
+        self.assertEqual(len(self.post_times), len(self.guids) - 1)
+        times = sorted(self.post_times)
+        for k, t in enumerate(times):
+            self.assertGreaterEqual(t - times[0], (k - max_workers + 1) * 60 / rpm - 0.02)
+
+        # a checkpoint every 3 patents, then the final save with nothing left
+        self.assertEqual(self.appended, [3, 3, 3, 3, 0])
+        raw, refined = self.extractor.store.read()
+        self.assertEqual(sorted(refined["id"]), sorted(self.guids))
+
+
+if __name__ == '__main__':
+    unittest.main()
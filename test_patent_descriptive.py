@@ -0,0 +1,30 @@
+import unittest
+import pandas as pd
+
+from patent_descriptive import group_frequency
+
+
+class TestGroupFrequency(unittest.TestCase):
+
+    def setUp(self):
+        # a categorical target, as returned by clean_by(compact=True), with a category used by no row
+        self.data = pd.DataFrame({
+            "decade": [1990, 1990, 1990, 2000, 2000],
+            "inventorState": pd.Categorical(["CA", "CA", "NY", "MA", "MA"], categories=["CA", "MA", "NY", "TX"]),
+        })
+
+    def test_categorical_target_drops_unused_categories(self):
+        counts = group_frequency(self.data, "decade", "inventorState")
+        self.assertTrue((counts["Frequency"] > 0).all())
+        self.assertEqual(counts[counts["decade"] == 1990]["inventorState"].tolist(), ["CA", "NY"])
+        self.assertEqual(counts[counts["decade"] == 1990]["Frequency"].tolist(), [2, 1])
+        self.assertEqual(counts[counts["decade"] == 2000]["inventorState"].tolist(), ["MA"])
+
+    def test_top_n_per_group(self):
+        counts = group_frequency(self.data, "decade", "inventorState", num=1)
+        self.assertEqual(counts["inventorState"].tolist(), ["CA", "MA"])
+        self.assertEqual(counts["Frequency"].tolist(), [2, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import pandas as pd
+import numpy as np
+
+
+def parse_date_column(dates):
+    """
+    Parse a column of dates such as "2000-01-01 00:00:00+00:00" into datetime64 values.
+    Only the first 10 characters (the calendar date) are kept, unparseable values become NaT.
+
+    Args:
+        dates (pd.Series) : column of dates, either strings or already parsed datetimes
+
+    Returns:
+        pd.Series : the parsed dates
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        if getattr(dates.dt, "tz", None) is not None:
+            dates = dates.dt.tz_localize(None)
+        return dates.dt.normalize()
+    return pd.to_datetime(dates.astype(str).str[:10], format="%Y-%m-%d", errors="coerce")
+
+def build_date_lookup(df, id_column="guid", date_column="datePublished"):
+    """
+    Build a guid -> date lookup from the basic dataframe. The dates are parsed only once here.
+    When a guid appears more than once, the first date is kept.
+
+    Args:
+        df (pd.DataFrame) : dataframe containing the ids and the dates
+        id_column (str, optional) : column of the ids. Defaults to "guid".
+        date_column (str, optional) : column of the dates. Defaults to "datePublished".
+
+    Returns:
+        pd.Series : the dates indexed by guid
+    """
+    lookup = pd.Series(parse_date_column(df[date_column]).to_numpy(), index=pd.Index(df[id_column]))
+    return lookup[~lookup.index.duplicated(keep="first")]
+
+def compute_citation_spans(edge_list, date_lookup, child_column="child", parent_column="parent"):
+    """
+    Compute the citation span (in days) of every edge in one pass.
+    Both ends of the edge list are joined to the date lookup through a hash index, and the spans are
+    computed as an integer-day array. Edges with a missing date on either end get <NA>.
+
+    Args:
+        edge_list (pd.DataFrame) : edge list with the citing (child) and cited (parent) ids
+        date_lookup (pd.Series) : dates indexed by guid, see build_date_lookup
+        child_column (str, optional) : column of the citing patents. Defaults to "child".
+        parent_column (str, optional) : column of the cited patents. Defaults to "parent".
+
+    Returns:
+        pd.arrays.IntegerArray : the span of every edge, aligned with the edge list
+    """
+    days = date_lookup.to_numpy(dtype="datetime64[D]")
+    known = ~np.isnat(days)
+    days = days.astype(np.int64)
+
+    child_pos = date_lookup.index.get_indexer(edge_list[child_column])
+    parent_pos = date_lookup.index.get_indexer(edge_list[parent_column])
+    valid = (child_pos >= 0) & (parent_pos >= 0)
+    valid[valid] = known[child_pos[valid]] & known[parent_pos[valid]]
+
+    spans = np.zeros(len(edge_list), dtype=np.int64)
+    spans[valid] = days[child_pos[valid]] - days[parent_pos[valid]]
+    return pd.arrays.IntegerArray(spans, ~valid)
+
+def earliest_by_category(df_classifications, date_lookup, levels=("0", "1", "2", "3"), id_column="4"):
+    """
+    Find the earliest patent and its date for every cpc category in a single groupby.
+    Ties on the earliest date are resolved by the first row of the category.
+
+    Args:
+        df_classifications (pd.DataFrame) : cpc classifications with one column per level and one for the ids
+        date_lookup (pd.Series) : dates indexed by guid, see build_date_lookup
+        levels (tuple, optional) : columns of the cpc levels. Defaults to ("0", "1", "2", "3").
+        id_column (str, optional) : column of the ids. Defaults to "4".
+
+    Returns:
+        pd.DataFrame : the guid, 1st_appeared_date and earliest_cate of every category
+    """
+    levels = list(levels)
+    df = df_classifications[levels + [id_column]].dropna(subset=levels).reset_index(drop=True)
+    df = df.assign(datePublished=df[id_column].map(date_lookup)).dropna(subset=["datePublished"])
+
+    earliest = df.loc[df.groupby(levels, sort=True)["datePublished"].idxmin()]
+    earliest_cate = earliest[levels[0]].astype(str)
+    for index, level in enumerate(levels[1:], start=1):
+        values = earliest[level]
+        if index > 1:
+            values = values.astype(np.int64)
+        earliest_cate = earliest_cate + "/" + values.astype(str)
+
+    return pd.DataFrame({
+        "guid": earliest[id_column].to_numpy(),
+        "1st_appeared_date": earliest["datePublished"].to_numpy(),
+        "earliest_cate": earliest_cate.to_numpy(),
+    })
@@ -0,0 +1,344 @@
+import os
+import pandas as pd
+import numpy as np
+
+
+def _build_csr(source, target, n_nodes):
+    """
+    Build the compressed sparse row arrays of the edges source -> target.
+    The targets of a node keep the order of the edge list.
+    """
+    order = np.argsort(source, kind="stable")
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(source, minlength=n_nodes), out=indptr[1:])
+    return indptr, target[order].astype(np.int32)
+
+def _gather(indptr, indices, nodes):
+    """
+    Gather the neighbors of several nodes at once.
+
+    Returns:
+        tuple : (position of the node in nodes for every neighbor, the neighbors)
+    """
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    owners = np.repeat(np.arange(len(nodes)), lengths)
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+    return owners, indices[offsets]
+
+
+class CitationIndex:
+    """
+    Compressed sparse row index over the citation graph, in both directions.
+    Patent ids are encoded as integers; citing[i] gives the patents cited by node i and cited[i] the patents citing it.
+    """
+    def __init__(self, guids, citing_indptr, citing_indices, cited_indptr, cited_indices):
+        self.guids = pd.Index(guids)
+        self._guid_array = self.guids.to_numpy(dtype=object)
+        self.citing_indptr = citing_indptr
+        self.citing_indices = citing_indices
+        self.cited_indptr = cited_indptr
+        self.cited_indices = cited_indices
+        self.node_dates = None
+
+    @classmethod
+    def from_edge_list(cls, edge_list, child_column="child", parent_column="parent"):
+        """
+        Build the index from an edge list where the child cites the parent.
+
+        Args:
+            edge_list (pd.DataFrame) : the edge list, the edges with a missing child or parent are left out
+            child_column (str, optional) : column of the citing patents. Defaults to "child".
+            parent_column (str, optional) : column of the cited patents. Defaults to "parent".
+
+        Returns:
+            CitationIndex : the index
+        """
+        # an edge with a missing end (e.g. a blank row) would be encoded as -1
+        edge_list = edge_list[[child_column, parent_column]].dropna()
+        n_edges = len(edge_list)
+        codes, guids = pd.factorize(pd.concat([edge_list[child_column], edge_list[parent_column]], ignore_index=True))
+        child, parent = codes[:n_edges], codes[n_edges:]
+        citing_indptr, citing_indices = _build_csr(child, parent, len(guids))
+        cited_indptr, cited_indices = _build_csr(parent, child, len(guids))
+        return cls(guids, citing_indptr, citing_indices, cited_indptr, cited_indices)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved with save.
+
+        Args:
+            path (str) : path to the .npz file
+
+        Returns:
+            CitationIndex : the index
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(arrays["guids"].astype(object), arrays["citing_indptr"], arrays["citing_indices"],
+                       arrays["cited_indptr"], arrays["cited_indices"])
+
+    def save(self, path):
+        """
+        Save the index to a .npz file.
+
+        Args:
+            path (str) : path to the .npz file
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, guids=self.guids.to_numpy(dtype=str), citing_indptr=self.citing_indptr,
+                 citing_indices=self.citing_indices, cited_indptr=self.cited_indptr, cited_indices=self.cited_indices)
+
+    def __len__(self):
+        return len(self.guids)
+
+    def encode(self, ids):
+        """
+        Encode patent ids to node numbers, -1 for the ids that are not in the graph.
+
+        Args:
+            ids (list) : list of patent ids
+
+        Returns:
+            np.ndarray : the node numbers
+        """
+        return self.guids.get_indexer(pd.Index(ids))
+
+    def _arrays(self, direction):
+        if direction == "citations":
+            return self.citing_indptr, self.citing_indices
+        if direction == "cited_by":
+            return self.cited_indptr, self.cited_indices
+        raise ValueError(f"Direction {direction} is not in the options.")
+
+    def _lookup(self, patent_id, direction):
+        indptr, indices = self._arrays(direction)
+        try:
+            node = self.guids.get_loc(patent_id)
+        except KeyError:
+            return []
+        return self._guid_array[indices[indptr[node]:indptr[node + 1]]].tolist()
+
+    def citations(self, patent_id):
+        """
+        With patent id given, return the list of cited patent ids.
+
+        Args:
+            patent_id (str) : patent id
+
+        Returns:
+            list : list of cited patent ids
+        """
+        return self._lookup(patent_id, "citations")
+
+    def cited_by(self, patent_id):
+        """
+        With patent id given, return the list of patents that cited the patent.
+
+        Args:
+            patent_id (str) : patent id
+
+        Returns:
+            list : list of patents that cited the patent
+        """
+        return self._lookup(patent_id, "cited_by")
+
+    def neighbors(self, nodes, direction="citations"):
+        """
+        Batched lookup on node numbers.
+
+        Args:
+            nodes (np.ndarray) : node numbers, see encode
+            direction (str, optional) : "citations" or "cited_by". Defaults to "citations".
+
+        Returns:
+            tuple : (position in nodes for every neighbor, the neighbor node numbers)
+        """
+        indptr, indices = self._arrays(direction)
+        return _gather(indptr, indices, np.asarray(nodes, dtype=np.int64))
+
+    def lookup_many(self, ids, direction="citations"):
+        """
+        Batched lookup on patent ids. Ids that are not in the graph are skipped.
+
+        Args:
+            ids (list) : list of patent ids
+            direction (str, optional) : "citations" or "cited_by". Defaults to "citations".
+
+        Returns:
+            pd.DataFrame : edge list with the child and parent columns
+        """
+        nodes = self.encode(ids)
+        nodes = nodes[nodes >= 0]
+        owners, found = self.neighbors(nodes, direction)
+        sources = self._guid_array[nodes[owners]]
+        targets = self._guid_array[found]
+        if direction == "citations":
+            return pd.DataFrame({"child": sources, "parent": targets})
+        return pd.DataFrame({"child": targets, "parent": sources})
+
+    def attach_dates(self, date_lookup):
+        """
+        Align the publication dates to the nodes so traversals can be filtered by date.
+
+        Args:
+            date_lookup (pd.Series) : dates indexed by guid, see utils.analysis_helper.build_date_lookup
+        """
+        self.node_dates = date_lookup.reindex(self.guids).to_numpy(dtype="datetime64[D]")
+
+    def _expand(self, frontier, direction):
+        if direction == "both":
+            owners_1, found_1 = self.neighbors(frontier, "citations")
+            owners_2, found_2 = self.neighbors(frontier, "cited_by")
+            return np.concatenate([owners_1, owners_2]), np.concatenate([found_1, found_2])
+        return self.neighbors(frontier, direction)
+
+    def traverse(self, ids, direction="citations", max_depth=1, date_range=None, max_results=None):
+        """
+        Breadth first expansion from a set of seed patents. Every level is expanded at once with array operations.
+        "citations" follows the references backward in time, "cited_by" follows the citing patents forward in time.
+
+        Args:
+            ids (list) : seed patent ids
+            direction (str, optional) : "citations", "cited_by" or "both". Defaults to "citations".
+            max_depth (int, optional) : number of hops, None for no limit. Defaults to 1.
+            date_range (tuple, optional) : only keep and expand the patents published in this range e.g. ("2000-01-01", "2010-12-31"). Needs attach_dates.
+            max_results (int, optional) : stop once this many patents are found. Defaults to no limit.
+
+        Returns:
+            pd.DataFrame : the guid and the depth of the patents found, seeds excluded
+        """
+        if date_range is not None:
+            if self.node_dates is None:
+                raise ValueError("Call attach_dates before filtering by date.")
+            start, end = (np.datetime64(pd.Timestamp(d).date(), "D") for d in date_range)
+
+        frontier = np.unique(self.encode(ids))
+        frontier = frontier[frontier >= 0]
+        visited = np.zeros(len(self), dtype=bool)
+        visited[frontier] = True
+
+        found_nodes, found_depths = [], []
+        n_found, depth = 0, 0
+        while len(frontier) and (max_depth is None or depth < max_depth):
+            depth += 1
+            _, found = self._expand(frontier, direction)
+            found = np.unique(found)
+            found = found[~visited[found]]
+            visited[found] = True
+            if date_range is not None:
+                dates = self.node_dates[found]
+                found = found[(dates >= start) & (dates <= end)]
+            if max_results is not None and n_found + len(found) > max_results:
+                found = found[:max_results - n_found]
+            found_nodes.append(found)
+            found_depths.append(np.full(len(found), depth, dtype=np.int32))
+            n_found += len(found)
+            if max_results is not None and n_found >= max_results:
+                break
+            frontier = found
+
+        nodes = np.concatenate(found_nodes) if found_nodes else np.array([], dtype=np.int64)
+        depths = np.concatenate(found_depths) if found_depths else np.array([], dtype=np.int32)
+        return pd.DataFrame({"guid": self._guid_array[nodes], "depth": depths})
+
+    def path(self, source_id, target_id, direction="citations", max_depth=None):
+        """
+        Shortest citation lineage from one patent to another.
+
+        Args:
+            source_id (str) : patent to start from
+            target_id (str) : patent to reach
+            direction (str, optional) : "citations", "cited_by" or "both". Defaults to "citations".
+            max_depth (int, optional) : number of hops, None for no limit. Defaults to None.
+
+        Returns:
+            list : the patent ids from source to target, empty if the target cannot be reached
+        """
+        source, target = self.encode([source_id, target_id])
+        if source < 0 or target < 0:
+            return []
+        predecessor = np.full(len(self), -1, dtype=np.int64)
+        predecessor[source] = source
+        frontier = np.array([source])
+        depth = 0
+        while len(frontier) and predecessor[target] < 0 and (max_depth is None or depth < max_depth):
+            depth += 1
+            owners, found = self._expand(frontier, direction)
+            new = predecessor[found] < 0
+            predecessor[found[new]] = frontier[owners[new]]
+            frontier = np.unique(found[new])
+        if predecessor[target] < 0:
+            return []
+
+        nodes = [target]
+        while nodes[-1] != source:
+            nodes.append(predecessor[nodes[-1]])
+        return self._guid_array[nodes[::-1]].tolist()
+
+    def count_reachable(self, ids, direction="cited_by", max_depth=None, date_range=None, max_results=None, batch_size=1024, max_cells=1 << 26):
+        """
+        Count the patents reachable from every seed, e.g. all the descendants citing it directly or indirectly.
+        The seeds are expanded together: the frontier holds (seed, node) pairs, and every level of every seed is expanded at once.
+        Each seed counts as if traversed alone, see traverse.
+
+        Args:
+            ids (list) : seed patent ids
+            direction (str, optional) : "citations", "cited_by" or "both". Defaults to "cited_by".
+            max_depth (int, optional) : number of hops, None for no limit. Defaults to None.
+            date_range (tuple, optional) : only count and expand the patents published in this range. Needs attach_dates.
+            max_results (int, optional) : stop counting a seed once this many patents are found. Defaults to no limit.
+            batch_size (int, optional) : maximum number of seeds expanded together. Defaults to 1024.
+            max_cells (int, optional) : maximum size of the visited (seed, node) matrix of a batch, in bytes. Defaults to 64 MiB.
+
+        Returns:
+            pd.Series : the number of patents reachable, indexed by the seed ids
+        """
+        if date_range is not None:
+            if self.node_dates is None:
+                raise ValueError("Call attach_dates before filtering by date.")
+            start, end = (np.datetime64(pd.Timestamp(d).date(), "D") for d in date_range)
+
+        nodes = self.encode(ids)
+        seeds = np.unique(nodes[nodes >= 0])
+        seed_counts = np.zeros(len(seeds), dtype=np.int64)
+        n_nodes = max(len(self), 1)
+        batch_size = max(1, min(batch_size, max_cells // n_nodes))
+        for begin in range(0, len(seeds), batch_size):
+            batch = seeds[begin:begin + batch_size].astype(np.int64)
+            counts = np.zeros(len(batch), dtype=np.int64)
+            # one row of visited nodes per seed, flattened: the pair (seed position, node) is seed position * n_nodes + node
+            visited = np.zeros(len(batch) * n_nodes, dtype=bool)
+            owners = np.arange(len(batch), dtype=np.int64)
+            frontier = batch
+            visited[owners * n_nodes + frontier] = True
+            depth = 0
+            while len(frontier) and (max_depth is None or depth < max_depth):
+                depth += 1
+                positions, found = self._expand(frontier, direction)
+                keys = owners[positions] * n_nodes + found
+                keys = pd.unique(keys[~visited[keys]])
+                visited[keys] = True
+                if date_range is not None:
+                    dates = self.node_dates[keys % n_nodes]
+                    keys = keys[(dates >= start) & (dates <= end)]
+                key_owners = keys // n_nodes
+                if max_results is not None:
+                    # keep the first pairs of every seed up to what is left of its limit
+                    keys = np.sort(keys)
+                    key_owners = keys // n_nodes
+                    rank = np.arange(len(keys)) - np.searchsorted(key_owners, key_owners)
+                    kept = rank < (max_results - counts)[key_owners]
+                    keys, key_owners = keys[kept], key_owners[kept]
+                counts += np.bincount(key_owners, minlength=len(batch))
+                if max_results is not None:
+                    # the seeds at their limit are not expanded any more
+                    kept = counts[key_owners] < max_results
+                    keys, key_owners = keys[kept], key_owners[kept]
+                owners, frontier = key_owners, keys % n_nodes
+            seed_counts[begin:begin + batch_size] = counts
+
+        result = np.zeros(len(nodes), dtype=np.int64)
+        known = nodes >= 0
+        result[known] = seed_counts[np.searchsorted(seeds, nodes[known])]
+        return pd.Series(result, index=pd.Index(ids, name="guid"), name="count")
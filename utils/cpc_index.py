@@ -0,0 +1,155 @@
+import re
+import pandas as pd
+import numpy as np
+
+# e.g. "F41", "F41A", "F41A3" or "F41C3/14"
+CPC_PREFIX_PATTERN = re.compile(r"^([A-Z]\d{2})([A-Z])?(?:(\d+)(?:/(\d+))?)?$")
+
+
+def parse_cpc_prefix(code):
+    """
+    Split a cpc code into its levels.
+
+    Args:
+        code (str or list) : cpc code e.g. "F41C3/14", or a list of levels e.g. ["F41", "C", "3", "14"]
+
+    Returns:
+        list : the levels e.g. ["F41", "C", "3", "14"]
+    """
+    if not isinstance(code, str):
+        return list(code)
+    match = CPC_PREFIX_PATTERN.match(code.replace(" ", ""))
+    if match is None:
+        raise ValueError(f"{code} is not a valid cpc code.")
+    return [level for level in match.groups() if level is not None]
+
+# full cpc code e.g. "F41A3/58": section, class, subclass, group and subgroup
+CPC_CODE_PATTERN = r'([A-Z])(\d+)([A-Z])(\d+)/(\d+)'
+CPC_PART_COLUMNS = ['category', 'subcategory1', 'subcategory2', 'subcategory3', 'subcategory4']
+
+
+def split_cpc_column(column):
+    """
+    Split a column of full cpc codes into their parts. Every distinct code is parsed once and the parts are mapped
+    back to the rows by the code number.
+
+    Args:
+        column (pd.Series) : cpc codes e.g. "F41A3/58"
+
+    Returns:
+        pd.DataFrame : category, subcategory1 and subcategory2 as categoricals (e.g. "F", "41", "A"),
+            subcategory3 and subcategory4 as Int32 (e.g. 3, 58), with the index of the column
+    """
+    codes, uniques = pd.factorize(column)
+    parts = pd.Series(uniques, dtype=object).str.extract(CPC_CODE_PATTERN)
+    parts.columns = CPC_PART_COLUMNS
+    split = {}
+    for name in CPC_PART_COLUMNS[:3]:
+        split[name] = pd.Categorical(parts[name]).take(codes, allow_fill=True)
+    for name in CPC_PART_COLUMNS[3:]:
+        split[name] = pd.array(pd.to_numeric(parts[name]), dtype="Int32").take(codes, allow_fill=True)
+    return pd.DataFrame(split, index=column.index)
+
+
+class CPCIndex:
+    """
+    Sorted composite key index over the cpc classifications.
+    The section/class/group/subgroup levels of every row are packed into one integer key, so all the patents under
+    a prefix such as F41A or F41C3/14 form one contiguous range of the sorted keys.
+    """
+    def __init__(self, df_classifications, levels=("0", "1", "2", "3"), id_column="4"):
+        """
+        Build the index.
+
+        Args:
+            df_classifications (pd.DataFrame) : cpc classifications with one column per level and one for the ids
+            levels (tuple, optional) : columns of the cpc levels. Defaults to ("0", "1", "2", "3").
+            id_column (str, optional) : column of the ids. Defaults to "4".
+        """
+        self.level_codes = []
+        self.radix = []
+        codes = []
+        for index, level in enumerate(levels):
+            values = df_classifications[level]
+            if index > 1:
+                # numeric levels, 0 is kept for the missing values
+                level_codes = None
+                code = values.fillna(-1).astype(np.int64).to_numpy() + 1
+            else:
+                code, uniques = pd.factorize(values, sort=True)
+                level_codes = {value: number + 1 for number, value in enumerate(uniques)}
+                code = code.astype(np.int64) + 1
+            self.level_codes.append(level_codes)
+            self.radix.append(int(code.max()) + 1 if len(code) else 1)
+            codes.append(code)
+
+        keys = np.zeros(len(df_classifications), dtype=np.int64)
+        for code, radix in zip(codes, self.radix):
+            keys = keys * radix + code
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.guids = df_classifications[id_column].to_numpy(dtype=object)[order]
+
+    def _encode(self, levels):
+        """
+        Encode the levels of a prefix, None if a level does not exist in the index.
+        """
+        encoded = []
+        for index, value in enumerate(levels):
+            if index > 1:
+                code = int(np.float64(value)) + 1
+                if code >= self.radix[index]:
+                    return None
+            else:
+                code = self.level_codes[index].get(value)
+                if code is None:
+                    return None
+            encoded.append(code)
+        return encoded
+
+    def _bounds(self, cpc_codes):
+        """
+        Lowest and highest keys under every prefix.
+        """
+        lows, highs = [], []
+        for cpc in cpc_codes:
+            encoded = self._encode(parse_cpc_prefix(cpc))
+            if encoded is None:
+                continue
+            low = high = 0
+            for index, radix in enumerate(self.radix):
+                low = low * radix + (encoded[index] if index < len(encoded) else 0)
+                high = high * radix + (encoded[index] if index < len(encoded) else radix - 1)
+            lows.append(low)
+            highs.append(high)
+        start = np.searchsorted(self.keys, np.array(lows, dtype=np.int64), side="left")
+        end = np.searchsorted(self.keys, np.array(highs, dtype=np.int64), side="right")
+        return start, end
+
+    def count(self, cpc_codes):
+        """
+        Upper bound of the number of patents under the prefixes, counting a patent once per classification.
+
+        Args:
+            cpc_codes (list) : cpc prefixes e.g. ["F41A", "F41C3/14"] or [["F41", "A"], ["F41", "C", "3", "14"]]
+
+        Returns:
+            int : the number of classifications under the prefixes
+        """
+        start, end = self._bounds(cpc_codes)
+        return int((end - start).sum())
+
+    def lookup(self, cpc_codes):
+        """
+        Find the patents under any of the prefixes.
+
+        Args:
+            cpc_codes (list) : cpc prefixes e.g. ["F41A", "F41C3/14"] or [["F41", "A"], ["F41", "C", "3", "14"]]
+
+        Returns:
+            np.ndarray : the deduplicated patent ids
+        """
+        start, end = self._bounds(cpc_codes)
+        lengths = end - start
+        offsets = np.repeat(start - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        return pd.unique(self.guids[offsets])
@@ -0,0 +1,145 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import unicodedata
+
+SPACES = re.compile(r"[ \t\r\f\v]+")
+
+
+def normalize_text(text):
+    """
+    Normalize a text before hashing it, so that changes of unicode form or of spacing do not change its key.
+
+    Args:
+        text (str) : the text
+
+    Returns:
+        str : the normalized text
+    """
+    return SPACES.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(text, num_keywords, n=3, lan="en"):
+    """
+    Key of the keywords of a text extracted with some settings.
+
+    Args:
+        text (str) : the text
+        num_keywords (int) : number of keywords extracted
+        n (int, optional) : maximum size of the n-grams. Defaults to 3.
+        lan (str, optional) : language of the text. Defaults to "en".
+
+    Returns:
+        str : the sha256 hex digest
+    """
+    digest = hashlib.sha256(f"{num_keywords}|{n}|{lan}|".encode())
+    digest.update(normalize_text(text).encode())
+    return digest.hexdigest()
+
+
+class KeywordCache:
+    """
+    Persistent cache of extracted keywords in a SQLite file, keyed by cache_key.
+    It keeps at most max_entries texts, evicting the least recently used ones, and counts its hits and misses.
+    """
+    def __init__(self, path="data/intermediate/keyword_cache.sqlite", max_entries=1_000_000):
+        """
+        Open the cache, creating the file if needed.
+
+        Args:
+            path (str, optional) : the SQLite file. Defaults to "data/intermediate/keyword_cache.sqlite".
+            max_entries (int, optional) : maximum number of texts kept. Defaults to 1_000_000.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS keywords (key TEXT PRIMARY KEY, keywords TEXT NOT NULL, last_used INTEGER NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS keywords_last_used ON keywords (last_used)")
+        self.connection.commit()
+        # counted once here then kept up to date, a COUNT(*) scans the whole table
+        self.size = self.connection.execute("SELECT COUNT(*) FROM keywords").fetchone()[0]
+        # the cache may have been filled with a larger max_entries
+        self._evict()
+        self.connection.commit()
+
+    def __len__(self):
+        return self.size
+
+    def _count(self, keys):
+        """
+        Number of the keys already stored.
+        """
+        count = 0
+        for start in range(0, len(keys), 500): # below the SQLite limit of parameters
+            chunk = keys[start:start + 500]
+            count += self.connection.execute(f"SELECT COUNT(*) FROM keywords WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchone()[0]
+        return count
+
+    def _evict(self):
+        """
+        Delete the least recently used entries above max_entries, without committing.
+        """
+        extra = self.size - self.max_entries
+        if extra > 0:
+            self.connection.execute("DELETE FROM keywords WHERE key IN (SELECT key FROM keywords ORDER BY last_used LIMIT ?)", (extra,))
+            self.evicted += extra
+            self.size -= extra
+
+    def get_many(self, keys):
+        """
+        Look up keys, marking the found ones as recently used.
+
+        Args:
+            keys (list) : the keys
+
+        Returns:
+            dict : the keywords list of every key found
+        """
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(unique_keys), 500): # below the SQLite limit of parameters
+            chunk = unique_keys[start:start + 500]
+            rows = self.connection.execute(f"SELECT key, keywords FROM keywords WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            found.update((key, json.loads(keywords)) for key, keywords in rows)
+        now = time.time_ns()
+        self.connection.executemany("UPDATE keywords SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+        self.connection.commit()
+        self.hits += sum(key in found for key in keys)
+        self.misses += sum(key not in found for key in keys)
+        return found
+
+    def put_many(self, items):
+        """
+        Store keywords, then evict the least recently used entries above max_entries.
+
+        Args:
+            items (dict) : the keywords list of every key
+        """
+        now = time.time_ns()
+        self.size += len(items) - self._count(list(items))
+        self.connection.executemany("INSERT OR REPLACE INTO keywords (key, keywords, last_used) VALUES (?, ?, ?)",
+                                    [(key, json.dumps(keywords), now) for key, keywords in items.items()])
+        self._evict()
+        self.connection.commit()
+
+    def report(self):
+        """
+        Statistics of the cache since it was opened.
+
+        Returns:
+            dict : hits, misses, hit_rate, evicted and size
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evicted": self.evicted, "size": len(self)}
+
+    def close(self):
+        self.connection.close()
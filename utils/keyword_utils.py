@@ -1,7 +1,12 @@
 import csv
+import yake
+import pandas as pd
+from collections import Counter, deque
 
 csv.field_size_limit(104857600)
 
+_extractor = None # keyword extractor of a worker process, see init_extractor
+
 # def extract_string(input_str):
 #     """
 #     Extracts the abstract from the input string.
@@ -62,6 +67,107 @@ def count_frequency(keywordlist, ngram_list):
         frequency[element] = ngram_list.count(element)
     return frequency
 
+def count_ngrams(tokens, max_n=3):
+    """
+    Counts the n-grams of a list of tokens, in one pass per n-gram size.
+
+    tokens (list): List of tokens.
+    max_n (int): Maximum size of the n-grams.
+
+    Returns:
+        Counter: Counter of the n-grams, as tuples of tokens.
+    """
+    counts = Counter()
+    for n in range(1, max_n + 1):
+        counts.update(zip(*(tokens[i:] for i in range(n))))
+    return counts
+
+def count_phrases(phrases, ngram_counts, encode=None):
+    """
+    Counts the frequency of phrases from the n-gram counts, as count_frequency does from the list of n-grams.
+
+    phrases (list): List of phrases e.g. keywords or catch words.
+    ngram_counts (Counter): Counter of the n-grams, see count_ngrams.
+    encode (function): Turns a phrase into the n-gram it is counted as, e.g. Tokenizer.phrase_ids for n-grams of token ids.
+        Defaults to the tuple of its words.
+
+    Returns:
+        dict: Dictionary containing phrase frequencies.
+    """
+    encode = encode or (lambda phrase: tuple(phrase.split(" ")))
+    return {phrase: ngram_counts.get(encode(phrase), 0) for phrase in phrases}
+
+def read_chunks(source, columns, chunksize=1000):
+    """
+    Reads some columns of a csv or parquet file by chunks of rows, so only one chunk is in memory at a time.
+
+    source (str): Path of the csv or parquet file.
+    columns (list): Columns to read.
+    chunksize (int): Number of rows per chunk.
+
+    Yields:
+        pd.DataFrame: The chunks, with a fresh index.
+    """
+    if source.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(source, usecols=columns, chunksize=chunksize):
+            yield chunk.reset_index(drop=True)
+
+def init_extractor(num_keywords, n=3, lan='en'):
+    """
+    Create the keyword extractor of a worker process. Used as the initializer of the process pool.
+
+    num_keywords (int): Number of keywords to extract.
+    n (int): Maximum size of the n-grams.
+    lan (str): Language of the texts.
+    """
+    global _extractor
+    _extractor = yake.KeywordExtractor(top=num_keywords, lan=lan, stopwords=None, n=n)
+
+def extract_keywords_batch(texts, extractor=None):
+    """
+    Extracts the keywords of a batch of texts.
+
+    texts (list): List of texts, None for the missing ones.
+    extractor (yake.KeywordExtractor): The extractor to use. Defaults to the one of the worker process.
+
+    Returns:
+        list: List of keyword lists, None for the missing texts.
+    """
+    extractor = extractor or _extractor
+    return [[keyword[0] for keyword in extractor.extract_keywords(text)] if text is not None else None
+            for text in texts]
+
+def extract_batches(batches, extractor=None, executor=None, max_pending=2):
+    """
+    Extracts the keywords of batches of texts, in order, consuming the batches as it goes.
+    In a process pool, at most max_pending batches are submitted ahead of the results read back.
+
+    batches (iterable): (context, texts) pairs; the context, e.g. the positions of the texts, is passed through.
+    extractor (yake.KeywordExtractor): The extractor used in this process, when there is no executor.
+    executor (ProcessPoolExecutor): The pool, created with init_extractor as initializer. Defaults to None, extracting in this process.
+    max_pending (int): Maximum number of batches submitted and not read back, e.g. twice the number of workers. Defaults to 2.
+
+    Yields:
+        tuple: The context and the keyword lists of the texts, None for the missing ones.
+    """
+    if executor is None:
+        for context, texts in batches:
+            yield context, extract_keywords_batch(texts, extractor)
+        return
+    pending = deque()
+    for context, texts in batches:
+        if len(pending) >= max_pending:
+            done, future = pending.popleft()
+            yield done, future.result()
+        pending.append((context, executor.submit(extract_keywords_batch, texts)))
+    while pending:
+        done, future = pending.popleft()
+        yield done, future.result()
+
 # def merge_dicts(key_freq, safe_freq):
 #     """
 #     Merges two dictionaries together.
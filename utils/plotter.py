@@ -0,0 +1,158 @@
+import os
+import re
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from matplotlib.figure import Figure
+import matplotlib.ticker as ticker
+
+CHART_KINDS = ["bar", "line", "hist"]
+MANIFEST_FILE = "manifest.json"
+
+
+def _render_chart(spec, file_path):
+    """
+    Draw one chart into a file, on a standalone figure with the Agg canvas (no pyplot, no window).
+
+    Args:
+        spec (dict) : the chart spec, see Plotter.add
+        file_path (str) : the image to write
+    """
+    options = spec["options"]
+    fig = Figure(figsize=options.get("figsize", (10, 6)))
+    ax = fig.subplots()
+    data = spec["data"]
+    if spec["kind"] == "hist":
+        ax.hist(data.dropna(), bins=options.get("bins", 50), color=options.get("color"), edgecolor=options.get("edgecolor"))
+    elif spec["kind"] == "bar":
+        data.plot(kind="bar", ax=ax, color=options.get("color"), width=options.get("width", 0.8))
+    else:
+        data.plot(kind=spec["kind"], ax=ax, color=options.get("color"))
+    ax.set_title(options.get("title", ""))
+    ax.set_xlabel(options.get("xlabel", ""))
+    ax.set_ylabel(options.get("ylabel", ""))
+    if "rotation" in options:
+        ax.tick_params(axis="x", labelrotation=options["rotation"])
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment("right")
+    if "locator" in options:
+        ax.xaxis.set_major_locator(ticker.MultipleLocator(base=options["locator"]))
+    if "grid" in options:
+        ax.grid(**options["grid"])
+    for spine in options.get("hide_spines", []):
+        ax.spines[spine].set_visible(False)
+    fig.tight_layout()
+    fig.savefig(file_path, dpi=options.get("dpi", 100))
+    return file_path
+
+
+def _render_job(job):
+    return _render_chart(*job)
+
+
+def chart_hash(spec):
+    """
+    Hash the content of a chart spec, so an unchanged chart is not drawn again.
+
+    Args:
+        spec (dict) : the chart spec, see Plotter.add
+
+    Returns:
+        str : the hex digest
+    """
+    digest = hashlib.sha1()
+    digest.update(spec["kind"].encode())
+    digest.update(json.dumps(spec["options"], sort_keys=True, default=str).encode())
+    data = spec["data"]
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(pd.Series(data.index.astype(str)), index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class Plotter:
+    """
+    Deferred plotting. The analysis functions add chart specs (the data to draw and the styling) while they run,
+    and render draws them all at once into image files, in parallel, skipping the charts that did not change since
+    the last render.
+
+    Example:
+        plotter = Plotter("output/charts")
+        freq_by_group(data, 'decade', 'inventorState', plotter = plotter)
+        plotter.render()
+    """
+    def __init__(self, output_path="output/charts", n_jobs=None, image_format="png"):
+        """
+        Args:
+            output_path (str, optional) : folder of the images and of the manifest of their hashes. Defaults to "output/charts".
+            n_jobs (int, optional) : number of rendering processes, None for one per cpu. Defaults to None.
+            image_format (str, optional) : extension of the images. Defaults to "png".
+        """
+        self.output_path = output_path
+        self.n_jobs = n_jobs
+        self.image_format = image_format
+        self.specs = {}
+        self.skipped = 0
+
+    def add(self, name, kind, data, **options):
+        """
+        Add a chart to render.
+
+        Args:
+            name (str) : name of the chart, used for the file name; a chart added again under the same name replaces the previous one
+            kind (str) : "bar", "line" or "hist"
+            data (pd.Series) : the values to draw, indexed by their labels
+            **options : title, xlabel, ylabel, figsize, color, edgecolor, width, bins, rotation, locator, grid (dict of ax.grid arguments), hide_spines, dpi
+
+        Returns:
+            str : the path of the image it will be rendered into
+        """
+        if kind not in CHART_KINDS:
+            raise ValueError(f"Kind {kind} is not in the options {CHART_KINDS}.")
+        name = re.sub(r"[^\w.-]+", "_", str(name))
+        self.specs[name] = {"kind": kind, "data": pd.Series(data), "options": options}
+        return self.file_path(name)
+
+    def file_path(self, name):
+        """
+        Path of the image of a chart.
+        """
+        return os.path.join(self.output_path, f"{name}.{self.image_format}")
+
+    def _read_manifest(self):
+        manifest_path = os.path.join(self.output_path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+
+    def render(self):
+        """
+        Render the charts added since the last render. The charts whose spec has the same hash as the one recorded
+        in the manifest, and whose image still exists, are skipped.
+
+        Returns:
+            dict : name of every chart and its image path
+        """
+        os.makedirs(self.output_path, exist_ok=True)
+        manifest = self._read_manifest()
+        jobs, hashes = [], {}
+        for name, spec in self.specs.items():
+            hashes[name] = chart_hash(spec)
+            if manifest.get(name) != hashes[name] or not os.path.exists(self.file_path(name)):
+                jobs.append((spec, self.file_path(name)))
+
+        if self.n_jobs == 1 or len(jobs) <= 1:
+            for job in jobs:
+                _render_job(job)
+        else:
+            with ProcessPoolExecutor(max_workers=self.n_jobs) as executor:
+                list(executor.map(_render_job, jobs))
+
+        manifest.update(hashes)
+        with open(os.path.join(self.output_path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=4)
+        rendered = {name: self.file_path(name) for name in self.specs}
+        self.specs = {}
+        self.skipped = len(hashes) - len(jobs)
+        return rendered
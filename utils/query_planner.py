@@ -0,0 +1,187 @@
+import pandas as pd
+import numpy as np
+
+
+class _DatePredicate:
+    def __init__(self, start, end):
+        self.start, self.end = start, end
+
+    def __repr__(self):
+        return f"datePublished between {self.start} and {self.end}"
+
+    def estimate(self, fetcher):
+        return fetcher.date_index.count(self.start, self.end)
+
+    def evaluate(self, fetcher, candidates):
+        if candidates is None:
+            return fetcher.date_index.range(self.start, self.end)
+        dates = fetcher.date_index.dates[candidates]
+        start, end = np.datetime64(pd.Timestamp(self.start)), np.datetime64(pd.Timestamp(self.end))
+        return candidates[(dates >= start) & (dates <= end)]
+
+
+class _ListPredicate:
+    def __init__(self, column_name, values, match, how, casefold=False):
+        self.column_name, self.values, self.match, self.how = column_name, list(values), match, how
+        self.casefold = casefold
+
+    def __repr__(self):
+        return f"{self.column_name} {self.match} {self.how} of {self.values}"
+
+    def estimate(self, fetcher):
+        index = fetcher.list_index(self.column_name, self.casefold)
+        counts = [index.count(value, self.match) for value in self.values]
+        if not counts:
+            return 0
+        return min(counts) if self.how == "all" else min(sum(counts), index.n_rows)
+
+    def evaluate(self, fetcher, candidates):
+        rows = fetcher.list_index(self.column_name, self.casefold).lookup(self.values, match=self.match, how=self.how)
+        if candidates is None:
+            return rows
+        return np.intersect1d(candidates, rows, assume_unique=True)
+
+
+class _CPCPredicate:
+    def __init__(self, cpc_codes):
+        self.cpc_codes = list(cpc_codes)
+
+    def __repr__(self):
+        return f"cpc under {self.cpc_codes}"
+
+    def estimate(self, fetcher):
+        return fetcher.cpc_index.count(self.cpc_codes)
+
+    def evaluate(self, fetcher, candidates):
+        ids = fetcher.cpc_index.lookup(self.cpc_codes)
+        guids = fetcher.df_basics['guid']
+        if candidates is None:
+            return np.flatnonzero(guids.isin(ids).to_numpy())
+        return candidates[guids.iloc[candidates].isin(ids).to_numpy()]
+
+
+class PatentQuery:
+    """
+    Query combining date, list and cpc filters on a Fetcher.
+    The predicates are evaluated from the most to the least selective, as estimated from the index statistics,
+    on the row numbers left by the previous ones. The rows are materialized once at the end.
+
+    Example:
+        fetcher.query().cpc(["F41A"]).published("2000-01-01", "2010-12-31").where("assigneeName", ["X"]).where("inventorState", ["CT"], match="exact").run()
+    """
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+        self.predicates = []
+        self.columns = None
+
+    def published(self, start, end):
+        """
+        Keep the patents published between start and end, both included.
+
+        Args:
+            start (str) : first date e.g. "2000-01-01"
+            end (str) : last date e.g. "2010-12-31"
+
+        Returns:
+            PatentQuery : the query
+        """
+        self.predicates.append(_DatePredicate(start, end))
+        return self
+
+    def where(self, column_name, values, match="contains", how="any", casefold=False):
+        """
+        Keep the patents whose list column matches the values, see Fetcher.subset_patents.
+
+        Args:
+            column_name (str) : name of the column e.g. "inventorState"; "datePublished" takes a (start, end) tuple
+            values (list) : the values e.g. ["CT", "MA"]
+            match (str, optional) : "exact", "prefix" or "contains". Defaults to "contains".
+            how (str, optional) : "any" or "all". Defaults to "any".
+            casefold (bool, optional) : match regardless of the case. Defaults to False.
+
+        Returns:
+            PatentQuery : the query
+        """
+        if column_name == "datePublished":
+            return self.published(*values)
+        if column_name not in self.fetcher.method_map:
+            raise ValueError(f"Column name {column_name} is not in the options.")
+        self.predicates.append(_ListPredicate(column_name, values, match, how, casefold))
+        return self
+
+    def cpc(self, cpc_codes):
+        """
+        Keep the patents classified under any of the cpc prefixes, see Fetcher.filter_patents_by_cpc.
+
+        Args:
+            cpc_codes (list) : cpc prefixes e.g. ["F41A", "F41C3/14"]
+
+        Returns:
+            PatentQuery : the query
+        """
+        self.predicates.append(_CPCPredicate(cpc_codes))
+        return self
+
+    def select(self, columns):
+        """
+        Only materialize these columns of the result.
+
+        Args:
+            columns (list) : the columns e.g. ["guid", "datePublished"]
+
+        Returns:
+            PatentQuery : the query
+        """
+        self.columns = list(columns)
+        return self
+
+    def plan(self):
+        """
+        The predicates in the order they will be evaluated.
+
+        Returns:
+            pd.DataFrame : the predicates and their estimated number of rows
+        """
+        estimates = [(predicate.estimate(self.fetcher), index) for index, predicate in enumerate(self.predicates)]
+        order = [index for _, index in sorted(estimates)]
+        return pd.DataFrame({
+            "predicate": [repr(self.predicates[index]) for index in order],
+            "estimate": [estimates[index][0] for index in order],
+        }, index=order)
+
+    def rows(self):
+        """
+        Evaluate the predicates and return the matching row numbers.
+
+        Returns:
+            np.ndarray : sorted row numbers (positions) of df_basics
+        """
+        candidates = None
+        for index in self.plan().index:
+            candidates = self.predicates[index].evaluate(self.fetcher, candidates)
+            if len(candidates) == 0:
+                break
+        if candidates is None:
+            return np.arange(len(self.fetcher.df_basics))
+        return candidates
+
+    def run(self):
+        """
+        Evaluate the query.
+
+        Returns:
+            pd.DataFrame : the matching patents, with only the selected columns
+        """
+        rows = self.rows()
+        df = self.fetcher.df_basics
+        if self.columns is None:
+            df_subset = df.iloc[rows]
+        else:
+            positions = df.columns.get_indexer(self.columns)
+            if (positions < 0).any():
+                raise KeyError(f"Columns not found: {[col for col, pos in zip(self.columns, positions) if pos < 0]}")
+            # rows and columns in one step, only the returned cells are copied
+            df_subset = df.iloc[rows, positions]
+        if "datePublished" in df_subset:
+            df_subset = df_subset.assign(datePublished=self.fetcher.date_index.dates[rows])
+        return df_subset
@@ -0,0 +1,104 @@
+import pandas as pd
+import numpy as np
+from scipy import sparse
+
+
+class DocumentTermMatrix:
+    """
+    Sparse document x term count matrix, e.g. the keyword and catch word counts of get_word_count.
+    Rows are documents (or groups of documents after group_sum), columns are the terms of the vocabulary.
+    """
+    def __init__(self, matrix, terms, index):
+        """
+        Args:
+            matrix (scipy.sparse matrix) : the counts, one row per document and one column per term
+            terms (list) : the term of every column
+            index (list) : the label of every row e.g. the patent ids
+        """
+        self.matrix = sparse.csr_matrix(matrix)
+        self.terms = np.asarray(terms, dtype=object)
+        self.index = pd.Index(index)
+        self.vocabulary = {term: column for column, term in enumerate(self.terms)}
+
+    @classmethod
+    def from_counts(cls, counts, index):
+        """
+        Build the matrix from one dictionary of term counts per document.
+
+        Args:
+            counts (list) : dictionaries of term:count, anything else (e.g. pd.NA) counts as an empty document
+            index (list) : the label of every document
+
+        Returns:
+            DocumentTermMatrix : the matrix, with the terms in order of first appearance
+        """
+        vocabulary = {}
+        rows, columns, values = [], [], []
+        for row, document in enumerate(counts):
+            if not isinstance(document, dict):
+                continue
+            for term, count in document.items():
+                if count:
+                    rows.append(row)
+                    columns.append(vocabulary.setdefault(term, len(vocabulary)))
+                    values.append(count)
+        matrix = sparse.csr_matrix((np.array(values, dtype=np.int64), (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64))),
+                                   shape=(len(counts), len(vocabulary)))
+        return cls(matrix, list(vocabulary), index)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def column(self, term):
+        """
+        Counts of one term in every row.
+
+        Args:
+            term (str) : the term e.g. "safety"
+
+        Returns:
+            pd.Series : the counts, indexed by the rows
+        """
+        if term not in self.vocabulary:
+            return pd.Series(0, index=self.index, name=term)
+        return pd.Series(self.matrix[:, self.vocabulary[term]].toarray().ravel(), index=self.index, name=term)
+
+    def corpus_frequency(self):
+        """
+        Total count of every term over all the rows.
+
+        Returns:
+            pd.Series : the counts indexed by term, in descending order
+        """
+        totals = np.asarray(self.matrix.sum(axis=0)).ravel()
+        return pd.Series(totals, index=self.terms, name='Frequency').sort_values(ascending=False, kind='stable')
+
+    def group_sum(self, groups):
+        """
+        Sum the rows by group, as one sparse product with the group indicator matrix.
+
+        Args:
+            groups (list) : the group of every row e.g. the decade of every patent; missing groups are left out
+
+        Returns:
+            DocumentTermMatrix : one row per group, sorted by group
+        """
+        codes, uniques = pd.factorize(pd.Series(groups).to_numpy(), sort=True)
+        kept = np.flatnonzero(codes >= 0)
+        indicator = sparse.csr_matrix((np.ones(len(kept), dtype=np.int64), (codes[kept], kept)), shape=(len(uniques), len(codes)))
+        return DocumentTermMatrix(indicator @ self.matrix, self.terms, uniques)
+
+    def to_frame(self, terms=None):
+        """
+        Dense dataframe of the counts.
+
+        Args:
+            terms (list, optional) : the terms to keep. Defaults to None, keeping all of them.
+
+        Returns:
+            pd.DataFrame : one row per row of the matrix and one column per term
+        """
+        if terms is None:
+            return pd.DataFrame(self.matrix.toarray(), index=self.index, columns=self.terms)
+        return pd.concat([self.column(term) for term in terms], axis=1)
@@ -0,0 +1,153 @@
+import time
+import queue
+import threading
+from requests.adapters import HTTPAdapter
+from utils.downloader import TokenBucket, RETRY_STATUS
+
+# estimated prompt tokens of one page image, that of a 1024x1024 image in high detail
+IMAGE_TOKENS = 765
+# marks the end of the payloads for the workers, and the end of a worker for the consumer
+_DONE = object()
+
+
+def estimate_tokens(payload):
+    """
+    Rough number of tokens a request counts against the token per minute limit: about 4 characters per text token,
+    IMAGE_TOKENS per image, plus the maximum number of tokens of the answer.
+
+    Args:
+        payload (dict) : the payload, see API_calling.create_payload
+
+    Returns:
+        int : the estimated tokens
+    """
+    tokens = payload.get("max_tokens", 0)
+    for message in payload["messages"]:
+        for part in message["content"]:
+            tokens += len(part["text"]) // 4 if part["type"] == "text" else IMAGE_TOKENS
+    return tokens
+
+
+class ExtractionPipeline:
+    """
+    Concurrent calls of the vision API, in three stages connected by bounded queues:
+    a producer thread encodes the images of one patent after the other into payloads,
+    a pool of worker threads sends them under request per minute and token per minute limits,
+    and the consumer, the calling thread, hands every response to a callback as soon as it arrives.
+    Encoding the next patents thus overlaps with waiting for the answers of the previous ones.
+    """
+    def __init__(self, api, headers, max_workers=4, rpm=60, tpm=None, retries=3, backoff=2.0, queue_size=None):
+        """
+        Args:
+            api (API_calling) : the API client, its url and payloads are used
+            headers (dict) : headers of the requests, with the API key
+            max_workers (int, optional) : number of concurrent requests. Defaults to 4.
+            rpm (float, optional) : maximum number of requests per minute, None for no limit. Defaults to 60.
+            tpm (float, optional) : maximum number of estimated tokens per minute, None for no limit. Defaults to None.
+            retries (int, optional) : number of retries of a request rate limited (429) or failed on the server side. Defaults to 3.
+            backoff (float, optional) : wait before the first retry in seconds, doubled at every retry. Defaults to 2.0.
+            queue_size (int, optional) : maximum number of encoded payloads waiting for a worker. Defaults to 2 * max_workers.
+        """
+        self.api = api
+        self.headers = headers
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.queue_size = queue_size or 2 * max_workers
+        self.request_limit = TokenBucket(rpm / 60, max(1, max_workers)) if rpm else None
+        self.token_limit = TokenBucket(tpm / 60, tpm) if tpm else None
+        self.stop = threading.Event()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.api.session.mount("http://", adapter)
+        self.api.session.mount("https://", adapter)
+
+    def _produce(self, groups, payloads):
+        try:
+            for identifier, image_paths in groups:
+                if self.stop.is_set():
+                    break
+                try:
+                    item = (identifier, self.api.create_payload(image_paths), None)
+                except OSError as e:
+                    item = (identifier, None, repr(e))
+                payloads.put(item)
+        finally:
+            for _ in range(self.max_workers):
+                payloads.put(_DONE)
+
+    def _send(self, payload):
+        """
+        Send one payload, waiting for the rate limits and retrying the rate limited and server side errors.
+
+        Returns:
+            tuple : the json response (None if there is none) and the error (None if there is none)
+        """
+        tokens = estimate_tokens(payload)
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            if self.request_limit is not None:
+                self.request_limit.acquire()
+            if self.token_limit is not None:
+                self.token_limit.acquire(tokens)
+            try:
+                response = self.api.post(payload, self.headers)
+            except Exception as e:
+                error = repr(e)
+                continue
+            if response.status_code not in RETRY_STATUS:
+                try:
+                    return response.json(), None
+                except ValueError:
+                    return None, f"status code {response.status_code}: invalid json"
+            error = f"status code {response.status_code}"
+        return None, error
+
+    def _work(self, payloads, results):
+        try:
+            while True:
+                item = payloads.get()
+                if item is _DONE:
+                    break
+                identifier, payload, error = item
+                if self.stop.is_set():
+                    continue
+                response = None
+                if payload is not None:
+                    response, error = self._send(payload)
+                results.put((identifier, response, error))
+        finally:
+            results.put(_DONE)
+
+    def run(self, groups, on_result):
+        """
+        Send the images of every patent and hand over the responses in order of arrival.
+
+        Args:
+            groups (iterable) : (id, image paths) pairs, one per patent
+            on_result (callable) : called with the id, the json response (None on failure) and the error (None on success)
+
+        Returns:
+            int : the number of responses handled
+        """
+        self.stop.clear()
+        payloads = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue()
+        threads = [threading.Thread(target=self._produce, args=(groups, payloads), daemon=True)]
+        threads += [threading.Thread(target=self._work, args=(payloads, results), daemon=True) for _ in range(self.max_workers)]
+        for thread in threads:
+            thread.start()
+        handled, running = 0, self.max_workers
+        try:
+            while running:
+                item = results.get()
+                if item is _DONE:
+                    running -= 1
+                    continue
+                on_result(*item)
+                handled += 1
+        finally:
+            # on an interruption, let the threads drain the queues without sending anything more
+            self.stop.set()
+        return handled